@@ -2,9 +2,36 @@
 
 import os
 import json
+import threading
+import uuid
 from pathlib import Path
 from flask import jsonify, request
-import shared_store
+import event_bus
+import long_poll
+
+# What the skill last handed to an Echo, as (record, version, etag). Kept
+# apart from shared_store: it has a different shape and must not overwrite
+# the per-player MA records. The version orders updates for long-poll
+# `since`; it restarts with the process, so the ETag is a random tag per
+# record instead.
+_lock = threading.Lock()
+_current = (None, 0, None)
+
+
+def _on_alexa_now_playing(payload):
+    global _current
+    with _lock:
+        _current = (payload, _current[1] + 1, uuid.uuid4().hex)
+
+
+def _etag_version(etag):
+    _record, version, current_etag = _current
+    return version if etag == current_etag else None
+
+
+event_bus.subscribe(event_bus.ALEXA_NOW_PLAYING, _on_alexa_now_playing)
+# Subscribed after _on_alexa_now_playing, so woken waiters see the new record.
+_waiter = long_poll.Waiter(event_bus.ALEXA_NOW_PLAYING)
 
 
 def register_routes(bp):
@@ -15,19 +42,23 @@ def register_routes(bp):
         if not stream_url:
             return jsonify({'error': 'Missing required fields'}), 400
 
-        shared_store._store = {
+        event_bus.publish(event_bus.ALEXA_NOW_PLAYING, {
             'streamUrl': stream_url,
             'title': data.get('title'),
             'secondary': data.get('secondary'),
             'imageUrl': data.get('imageUrl'),
-        }
+        })
         return jsonify({'status': 'ok'})
 
     @bp.route('/latest-url', methods=['GET'])
     def latest_url():
-        if not shared_store._store:
+        long_poll.wait_newer(_waiter, request, lambda: _current[1] if _current[0] else None, _etag_version)
+        store, _version, etag = _current
+        if not store:
             return jsonify({'error': 'Check skill invocations and skill logs.  If there are no invocations, you have made a configuration error'}), 404
-        return jsonify(shared_store._store)
+        resp = jsonify(store)
+        resp.set_etag(etag)
+        return resp.make_conditional(request)
     
     @bp.route('/intents', methods=['GET'])
     def intents():
@@ -1,7 +1,13 @@
 import os
 from flask import Flask, request, jsonify, Response, g
-from flask_ask_sdk.skill_adapter import SkillAdapter
+from flask_ask_sdk.skill_adapter import VERIFY_SIGNATURE_APP_CONFIG, VERIFY_TIMESTAMP_APP_CONFIG
 from skill.lambda_function import sb  # sb is the SkillBuilder from skill/lambda_function.py
+from skill import apl as skill_apl, fast_refresh
+from ask_sdk_core.exceptions import AskSdkException
+from ask_sdk_webservice_support import verifier_constants
+from ask_sdk_webservice_support.verifier import RequestVerifier, TimestampVerifier, VerificationException
+from ask_sdk_webservice_support.webservice_handler import WebserviceSkillHandler
+from werkzeug import exceptions as http_exceptions
 import json
 import music_assistant_api as ma_api
 import alexa_api as alexa_api
@@ -23,6 +29,11 @@ import logging
 from setup_helpers import sanitize_log, enqueue_setup_log, setup_reader_thread as _helpers_setup_reader_thread, read_master_loop as _helpers_read_master_loop
 from setup_helpers import ask_home_from_credentials_dir, has_functional_cli_config, prepare_cli_config_for_configure
 from signal_helpers import register_signal_handlers
+import dns_cache
+
+# Resolve outbound hostnames (MA_HOSTNAME, stream hosts) through the
+# in-process cache instead of the system resolver on every request.
+dns_cache.install()
 
 
 def _load_addon_options_into_env():
@@ -90,10 +101,21 @@ try:
         app.logger.info('Using ASK credentials under HOME=%s', ask_home)
 except Exception:
     pass
-skill_adapter = SkillAdapter(
-    skill=sb.create(),
-    skill_id="", # pyright: ignore[reportArgumentType]
-    app=app)
+custom_skill = sb.create()
+# Request verification applied to every non-simulator request, with the
+# settings flask_ask_sdk's SkillAdapter would use (both on unless disabled
+# in the app config). Built here rather than read back from a handler, so
+# the fast refresh path (_fast_refresh) and the full dispatch share one
+# explicit list.
+_verifiers = []
+if app.config.get(VERIFY_SIGNATURE_APP_CONFIG, True):
+    _verifiers.append(RequestVerifier())
+if app.config.get(VERIFY_TIMESTAMP_APP_CONFIG, True):
+    _verifiers.append(TimestampVerifier())
+_skill_handler = WebserviceSkillHandler(custom_skill, verify_signature=False, verify_timestamp=False, verifiers=_verifiers)
+# Responses are serialized by _skill_response(), which understands cached
+# APL directives.
+skill_apl.enable_directive_splicing()
 
 # Mount the Music Assistant API (only ma routes will be mounted at /ma)
 ma_app = ma_api.create_ma_app()
@@ -177,6 +199,9 @@ def _check_app_basic_auth():
     # Allow the Alexa skill POST endpoint to be called without app-level auth
     if request.path == '/' and request.method == 'POST':
         return None
+    # Echo devices fetch cover art without credentials; only registered keys are served.
+    if request.path.startswith('/artwork/') and request.method in ('GET', 'HEAD'):
+        return None
     # Read credentials from secrets (APP_USERNAME/APP_PASSWORD)
     app_user = get_env_secret('APP_USERNAME')
     app_pass = get_env_secret('APP_PASSWORD')
@@ -260,11 +285,12 @@ app.config['INTENT_LOGS_MAXLEN'] = 500
 
 # Register endpoint blueprints moved out of app.py (status, invocations, simulator)
 try:
-    from endpoints import status_bp, invocations_bp, simulator_bp, devices_bp
+    from endpoints import status_bp, invocations_bp, simulator_bp, devices_bp, artwork_bp
     app.register_blueprint(status_bp)
     app.register_blueprint(invocations_bp)
     app.register_blueprint(simulator_bp)
     app.register_blueprint(devices_bp)
+    app.register_blueprint(artwork_bp)
 except Exception:
     app.logger.exception('Could not register endpoints blueprints (may be running in partial state)')
 
@@ -310,19 +336,60 @@ def invoke_skill():
     try:
         if request.headers.get('X-Simulator-Bypass') or request.headers.get('X-Simulator-Signature'):
             try:
-                from ask_sdk_webservice_support.webservice_handler import WebserviceSkillHandler
-                from ask_sdk_webservice_support import verifier_constants
                 content = request.data.decode(verifier_constants.CHARACTER_ENCODING)
-                handler = WebserviceSkillHandler(skill_adapter._skill, verify_signature=False, verify_timestamp=False, verifiers=[])
+                fast = _fast_refresh(content, verifiers=[])
+                if fast is not None:
+                    return fast
+                handler = WebserviceSkillHandler(custom_skill, verify_signature=False, verify_timestamp=False, verifiers=[])
                 response = handler.verify_request_and_dispatch(http_request_headers=request.headers, http_request_body=content)
-                return jsonify(response)
+                return _skill_response(response)
             except Exception:
                 app.logger.exception('Simulator dispatch without verification failed')
                 # fallthrough to normal dispatch
                 pass
     except Exception:
         pass
-    return skill_adapter.dispatch_request()
+    return _dispatch_verified()
+
+
+def _skill_response(response):
+    # Serialized via skill.apl so cached APL directive JSON is spliced in as-is.
+    return Response(skill_apl.to_json(response), mimetype='application/json')
+
+
+def _fast_refresh(content, verifiers):
+    """Answer an unchanged APL MetadataRefresh without the full skill dispatch, or return None."""
+    # Parsed (and cached by Flask) in _capture_incoming_intent already.
+    payload = request.get_json(silent=True)
+    if not fast_refresh.unchanged(payload):
+        return None
+    if verifiers:
+        envelope = fast_refresh.verification_view(payload)
+        if envelope is None:
+            return None
+        for verifier in verifiers:
+            verifier.verify(headers=request.headers, serialized_request_env=content,
+                            deserialized_request_env=envelope)
+    text = fast_refresh.respond(payload)
+    return Response(text, mimetype='application/json') if text is not None else None
+
+
+def _dispatch_verified():
+    """Verify and dispatch a skill request (as SkillAdapter.dispatch_request() does), serialized by _skill_response()."""
+    try:
+        content = request.data.decode(verifier_constants.CHARACTER_ENCODING)
+        fast = _fast_refresh(content, _verifiers)
+        if fast is not None:
+            return fast
+        response = _skill_handler.verify_request_and_dispatch(
+            http_request_headers=request.headers, http_request_body=content)
+        return _skill_response(response)
+    except VerificationException:
+        app.logger.error('Request verification failed', exc_info=True)
+        raise http_exceptions.BadRequest(description='Incoming request failed verification')
+    except AskSdkException:
+        app.logger.error('Skill dispatch exception', exc_info=True)
+        raise http_exceptions.InternalServerError(description='Exception occurred during skill dispatch')
 
 # Expose OpenAPI spec and Swagger UI from the main app so docs are available
 # at `/openapi.json` and `/docs` (keeps documentation separate from the API
@@ -0,0 +1,425 @@
+"""Viewport-sized cover art served from a local disk cache (/artwork).
+
+Pushed image URLs point at full-size Music Assistant artwork, which every
+Echo Show would otherwise download through the public MA_HOSTNAME. When
+the proxy is enabled (SKILL_HOSTNAME is set and ARTWORK_PROXY is not
+false), ma_routes offers each pushed image URL here and the record
+carries a https://SKILL_HOSTNAME/artwork/<key>/<variant> URL instead. The
+original is fetched from the URL as MA pushed it (MA's own address), not
+through MA_HOSTNAME.
+
+An offered URL is only registered (saved and prefetched) once a record
+carrying it is published, so pushes that are coalesced away or rate
+limited cost no fetches or disk writes. The original is fetched once per
+key (in the background as soon as it is registered), resized and
+re-encoded as JPEG into the VARIANTS sizes, and
+the files are kept in ARTWORK_CACHE_DIR, evicting the least recently
+served ones beyond ARTWORK_CACHE_MAX_MB. Without Pillow the original bytes
+are cached and served unchanged for every variant.
+
+The same pass derives what the APL player paints while the cover itself
+downloads: the image's dominant colour (kept in memory) and the blurred
+"preview" variant. placeholder() only looks these up; a key whose colour
+is not known yet (e.g. after a restart) is filled in the background.
+
+Only registered keys are served, so the endpoint cannot be used to fetch
+arbitrary URLs. The key -> URL registry is saved next to the files so
+records restored at startup keep working.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import requests
+
+import event_bus
+import latency
+import singleflight
+from env import int_env
+
+try:
+    from PIL import Image, ImageFilter
+except ImportError:  # Optional: without Pillow originals are passed through.
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels. cover is the AlexaImage (at most 425dp square),
+# background fills the screen; thumb suits small and round viewports and
+# list items; preview is blurred and stretched under the cover while it loads.
+VARIANTS = {
+    'preview': 32,
+    'thumb': 256,
+    'cover': 512,
+    'background': 1280,
+}
+_DEFAULT_DIR = '/app/instance_data/artwork'
+_REGISTRY_FILE = 'sources.json'
+# Room for the queue view's thumbnails besides the pushed covers.
+_REGISTRY_MAX = 2048
+_JPEG_QUALITY = 85
+_PREVIEW_BLUR = 2
+# Images are reduced to this size and palette to find the dominant colour.
+_COLOR_SAMPLE = 64
+_COLOR_PALETTE = 8
+_MAX_SOURCE_BYTES = 20 * 1024 * 1024
+_OFFERED_MAX = 256
+_KEY = re.compile(r'[0-9a-f]{20}')
+_PATH = re.compile(r'/artwork/([0-9a-f]{20})/(' + '|'.join(VARIANTS) + r')$')
+
+_lock = threading.Lock()
+_registry = None
+# key -> '#rrggbb' dominant colour, bounded like the registry.
+_colors = OrderedDict()
+_filling = set()
+# key -> source URL offered by a push that has not been published yet.
+_offered = OrderedDict()
+_stats = {'hits': 0, 'misses': 0, 'fetch_errors': 0, 'evicted': 0}
+
+
+def _cache_dir():
+    return os.environ.get('ARTWORK_CACHE_DIR', _DEFAULT_DIR)
+
+
+def _max_bytes():
+    return int_env('ARTWORK_CACHE_MAX_MB', 64) * 1024 * 1024
+
+
+def _public_base():
+    host = os.environ.get('SKILL_HOSTNAME', '').strip().rstrip('/')
+    if not host:
+        return None
+    if '://' not in host:
+        host = 'https://' + host
+    return host
+
+
+def enabled():
+    if os.environ.get('ARTWORK_PROXY', 'true').lower() not in ('true', '1', 'yes'):
+        return False
+    return _public_base() is not None
+
+
+def _key(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:20]
+
+
+def _load_registry():
+    global _registry
+    if _registry is None:
+        _registry = OrderedDict()
+        try:
+            with open(os.path.join(_cache_dir(), _REGISTRY_FILE), 'r') as f:
+                _registry.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning('Could not load artwork registry: %s', e)
+    return _registry
+
+
+def _save_registry(snapshot):
+    directory = _cache_dir()
+    path = os.path.join(directory, _REGISTRY_FILE)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Saved outside _lock, so concurrent saves need their own temporary files.
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning('Could not save artwork registry: %s', e)
+
+
+def register_all(urls, warm=True):
+    """Allow each url to be served through the proxy; return their keys.
+
+    New keys are saved to the registry in one write and, if warm, fetched
+    in the background before the first Echo asks for them.
+    """
+    keys = [_key(url) for url in urls]
+    new = []
+    with _lock:
+        registry = _load_registry()
+        for key, url in zip(keys, urls):
+            if registry.get(key) != url:
+                new.append(key)
+            registry.pop(key, None)
+            registry[key] = url
+        while len(registry) > _REGISTRY_MAX:
+            registry.popitem(last=False)
+        snapshot = dict(registry) if new else None
+        if warm:
+            _filling.update(new)
+    if snapshot is not None:
+        _save_registry(snapshot)
+        if warm:
+            threading.Thread(target=_warm_all, args=(new,), daemon=True).start()
+    return keys
+
+
+def register(url, warm=True):
+    """Allow url to be served through the proxy; return its key."""
+    return register_all([url], warm=warm)[0]
+
+
+def public_url(source_url, default, variant='cover'):
+    """Return the proxy URL for source_url (registering it), or default if the proxy is off."""
+    if not source_url or not enabled():
+        return default
+    return f"{_public_base()}/artwork/{register(source_url)}/{variant}"
+
+
+def offer(source_url, default, variant='cover'):
+    """Return the proxy URL public_url() would, but register it only when a record using it is published."""
+    if not source_url or not enabled():
+        return default
+    key = _key(source_url)
+    with _lock:
+        _offered.pop(key, None)
+        _offered[key] = source_url
+        while len(_offered) > _OFFERED_MAX:
+            _offered.popitem(last=False)
+    return f"{_public_base()}/artwork/{key}/{variant}"
+
+
+def _on_now_playing(snapshot):
+    match = _PATH.search(snapshot.image_url or '')
+    if match is None:
+        return
+    with _lock:
+        url = _offered.pop(match.group(1), None)
+    if url is not None:
+        register(url)
+
+
+event_bus.subscribe(event_bus.NOW_PLAYING, _on_now_playing)
+
+
+def public_urls(sources, variant='cover', warm=True):
+    """public_url() for a list of (source_url, default) pairs, registering them together."""
+    if not enabled():
+        return [default for _source, default in sources]
+    urls = [source for source, _default in sources if source]
+    keys = iter(register_all(urls, warm=warm)) if urls else iter(())
+    base = _public_base()
+    return [f"{base}/artwork/{next(keys)}/{variant}" if source else default
+            for source, default in sources]
+
+
+def variant_url(url, variant):
+    """Return a proxy URL switched to another variant; other URLs are returned unchanged."""
+    if url and _PATH.search(url):
+        return url[:url.rindex('/') + 1] + variant
+    return url
+
+
+def _sniff(data):
+    if data[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    return 'application/octet-stream'
+
+
+def resize(data, size, blur=0):
+    """Return data re-encoded as a JPEG no larger than size x size pixels (never upscaled)."""
+    with Image.open(BytesIO(data)) as image:
+        image.draft('RGB', (size, size))
+        image = image.convert('RGB')
+        image.thumbnail((size, size), Image.LANCZOS)
+        if blur:
+            image = image.filter(ImageFilter.GaussianBlur(blur))
+        out = BytesIO()
+        image.save(out, 'JPEG', quality=_JPEG_QUALITY, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+def dominant_color(data):
+    """Return the most common colour of a small palette of the image as '#rrggbb'."""
+    with Image.open(BytesIO(data)) as image:
+        image.draft('RGB', (_COLOR_SAMPLE, _COLOR_SAMPLE))
+        image = image.convert('RGB')
+        image.thumbnail((_COLOR_SAMPLE, _COLOR_SAMPLE))
+        quantized = image.quantize(colors=_COLOR_PALETTE)
+        _count, index = max(quantized.getcolors())
+        palette = quantized.getpalette()
+        return '#{:02x}{:02x}{:02x}'.format(*palette[index * 3:index * 3 + 3])
+
+
+def _remember_color(key, color):
+    with _lock:
+        _colors.pop(key, None)
+        _colors[key] = color
+        while len(_colors) > _REGISTRY_MAX:
+            _colors.popitem(last=False)
+
+
+def _variant_path(key, variant):
+    return os.path.join(_cache_dir(), f"{key}-{variant}")
+
+
+def _fetch(url):
+    timeout = latency.timeout_for('artwork', url)
+    with latency.measure('artwork', url):
+        resp = requests.get(url, timeout=timeout, stream=True)
+    try:
+        resp.raise_for_status()
+        data = resp.raw.read(_MAX_SOURCE_BYTES + 1, decode_content=True)
+    finally:
+        resp.close()
+    if len(data) > _MAX_SOURCE_BYTES:
+        raise ValueError(f'artwork larger than {_MAX_SOURCE_BYTES} bytes')
+    return data
+
+
+def _write(path, data):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _learn_color(key, data):
+    if Image is None:
+        return
+    try:
+        _remember_color(key, dominant_color(data))
+    except Exception as e:
+        logger.debug('Could not find the colour of artwork %s: %s', key, e)
+
+
+def _materialize(key):
+    """Fetch the original for key once and write every variant; return True on success."""
+    with _lock:
+        url = _load_registry().get(key)
+        known_color = key in _colors
+    if url is None:
+        return False
+    if all(os.path.exists(_variant_path(key, v)) for v in VARIANTS):
+        if not known_color:
+            try:
+                with open(_variant_path(key, 'thumb'), 'rb') as f:
+                    _learn_color(key, f.read())
+            except OSError:
+                pass
+        return True
+    try:
+        original = _fetch(url)
+        os.makedirs(_cache_dir(), exist_ok=True)
+        # Smallest first: the preview is what a device asks for first.
+        for variant, size in VARIANTS.items():
+            data = original
+            if Image is not None:
+                try:
+                    data = resize(original, size, blur=_PREVIEW_BLUR if variant == 'preview' else 0)
+                except Exception as e:
+                    # Unreadable for Pillow (e.g. SVG): serve the original.
+                    logger.debug('Could not resize artwork %s: %s', key, e)
+            _write(_variant_path(key, variant), data)
+            if variant == 'thumb':
+                _learn_color(key, data)
+    except (requests.RequestException, OSError, ValueError) as e:
+        with _lock:
+            _stats['fetch_errors'] += 1
+        logger.warning('Could not cache artwork %s: %s', url, e)
+        return False
+    _evict()
+    return True
+
+
+def _warm_all(keys):
+    for key in keys:
+        try:
+            singleflight.do(('artwork', key), _materialize, key)
+        except Exception:
+            logger.exception('Artwork prefetch failed')
+        finally:
+            with _lock:
+                _filling.discard(key)
+
+
+def placeholder(url):
+    """Return (dominant colour, preview URL) for a proxy URL, or None if not known yet.
+
+    Never fetches or decodes anything itself: for a registered key whose
+    colour is missing the work is started in the background and a later
+    call finds it.
+    """
+    match = _PATH.search(url or '')
+    if match is None or Image is None:
+        return None
+    key = match.group(1)
+    with _lock:
+        color = _colors.get(key)
+        if color is not None:
+            _colors.move_to_end(key)
+            return color, url[:match.start()] + f"/artwork/{key}/preview"
+        start = key not in _filling and key in _load_registry()
+        if start:
+            _filling.add(key)
+    if start:
+        threading.Thread(target=_warm_all, args=([key],), daemon=True).start()
+    return None
+
+
+def _evict():
+    directory = _cache_dir()
+    try:
+        entries = [e for e in os.scandir(directory)
+                   if e.is_file() and e.name != _REGISTRY_FILE and not e.name.endswith('.tmp')]
+    except OSError:
+        return
+    files = sorted((e.stat().st_mtime, e.stat().st_size, e.path) for e in entries)
+    total = sum(size for _mtime, size, _path in files)
+    limit = _max_bytes()
+    for _mtime, size, path in files:
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        with _lock:
+            _stats['evicted'] += 1
+
+
+def get(key, variant):
+    """Return (path, etag, mimetype) for a cached variant, fetching it if needed; None if unknown."""
+    if variant not in VARIANTS or not _KEY.fullmatch(key):
+        return None
+    path = _variant_path(key, variant)
+    hit = os.path.exists(path)
+    if not hit and not singleflight.do(('artwork', key), _materialize, key):
+        return None
+    try:
+        # The mtime orders files for eviction, so a hit marks the file recently used.
+        os.utime(path)
+        with open(path, 'rb') as f:
+            head = f.read(12)
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+    with _lock:
+        _stats['hits' if hit else 'misses'] += 1
+    # Files for a key are written once, so key, variant and size identify the content.
+    return path, f"{key}-{variant}-{size}", _sniff(head)
+
+
+def stats():
+    with _lock:
+        result = dict(_stats, registered=len(_registry or ()), offered=len(_offered), colors=len(_colors),
+                      pillow=Image is not None)
+    return result
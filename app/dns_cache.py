@@ -0,0 +1,201 @@
+"""In-process DNS resolution cache for outbound HTTP.
+
+Every stream URL probe and every request to MA_HOSTNAME used to go through
+the system resolver, which on Home Assistant hosts is often slow or flaky.
+Lookups are cached here and shared by:
+
+- `requests`/urllib3 (installed via install(), called once from app.py),
+- the aiohttp session used for MA commands (see skill/ma_control.py),
+- the simulator's DNS-over-HTTPS lookup (resolve_doh()).
+
+The system resolver does not report TTLs, so its answers live for
+DNS_CACHE_TTL_SECONDS; DoH answers use the TTL from the response. Failed
+lookups are cached for DNS_CACHE_NEGATIVE_TTL_SECONDS. An entry used in the
+last part of its lifetime is refreshed in the background so callers keep
+hitting the cache. Miss latency is recorded under the 'dns' kind in
+latency.py, separately from the request it precedes.
+"""
+
+import ipaddress
+import logging
+import socket
+import threading
+import time
+
+import latency
+import singleflight
+from env import float_env
+
+logger = logging.getLogger(__name__)
+
+_DOH_ENDPOINT = 'https://cloudflare-dns.com/dns-query'
+# Refresh in the background once this fraction of an entry's TTL has passed.
+_REFRESH_AFTER = 0.8
+
+_lock = threading.Lock()
+_entries = {}
+_stats = {'hits': 0, 'misses': 0, 'negative_hits': 0, 'refreshes': 0}
+
+
+def _ttl():
+    return float_env('DNS_CACHE_TTL_SECONDS', 300)
+
+
+def _negative_ttl():
+    return float_env('DNS_CACHE_NEGATIVE_TTL_SECONDS', 30)
+
+
+class _Entry:
+    __slots__ = ('value', 'error', 'created', 'expires', 'refreshing')
+
+    def __init__(self, value, error, ttl):
+        self.value = value
+        self.error = error
+        self.created = time.monotonic()
+        self.expires = self.created + ttl
+        self.refreshing = False
+
+    def needs_refresh(self, now):
+        return (self.error is None and not self.refreshing and
+                now >= self.created + (self.expires - self.created) * _REFRESH_AFTER)
+
+
+def _is_ip_literal(host):
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def _lookup(key, resolver):
+    """Run resolver() and cache the outcome (value, or the lookup error)."""
+    host = key[1]
+    started = time.monotonic()
+    try:
+        value, ttl = resolver()
+        entry = _Entry(value, None, ttl if ttl is not None else _ttl())
+    except OSError as e:
+        entry = _Entry(None, e, _negative_ttl())
+    latency.observe('dns', host, time.monotonic() - started)
+    with _lock:
+        _entries[key] = entry
+    return entry
+
+
+def _refresh(key, resolver):
+    try:
+        entry = _lookup(key, resolver)
+        if entry.error is not None:
+            logger.debug('Background DNS refresh for %s failed: %s', key[1], entry.error)
+    except Exception:
+        logger.exception('Background DNS refresh for %s failed', key[1])
+
+
+def _cached(key, resolver):
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and now < entry.expires:
+            if entry.error is not None:
+                _stats['negative_hits'] += 1
+            else:
+                _stats['hits'] += 1
+                if entry.needs_refresh(now):
+                    entry.refreshing = True
+                    _stats['refreshes'] += 1
+                    threading.Thread(target=_refresh, args=(key, resolver),
+                                     name='dns-refresh', daemon=True).start()
+        else:
+            entry = None
+            _stats['misses'] += 1
+
+    if entry is None:
+        entry = singleflight.do(key, _lookup, key, resolver)
+    if entry.error is not None:
+        raise type(entry.error)(*entry.error.args)
+    return entry.value
+
+
+def resolve(host, port, family=socket.AF_UNSPEC, type=socket.SOCK_STREAM):
+    """Cached socket.getaddrinfo(host, port, family, type)."""
+    if not host or _is_ip_literal(host):
+        return socket.getaddrinfo(host, port, family, type)
+
+    def resolver():
+        return socket.getaddrinfo(host, port, family, type), None
+
+    return _cached(('dns', host.lower(), port, family, type), resolver)
+
+
+def resolve_doh(hostname):
+    """Resolve hostname to one IPv4 address via DNS-over-HTTPS (Cloudflare).
+
+    Bypasses the local resolver and /etc/hosts; returns None on failure.
+    """
+    import requests
+
+    def resolver():
+        try:
+            resp = requests.get(_DOH_ENDPOINT, params={'name': hostname, 'type': 'A'},
+                                headers={'Accept': 'application/dns-json'},
+                                timeout=latency.timeout_for('metadata', _DOH_ENDPOINT))
+            resp.raise_for_status()
+            answers = resp.json().get('Answer') or []
+        except (requests.RequestException, ValueError) as e:
+            raise OSError(f'DoH lookup for {hostname} failed: {e}') from None
+        # Type 1 = A record; CNAME answers (type 5) precede them in a chain.
+        records = [a for a in answers if a.get('type') == 1 and isinstance(a.get('data'), str)]
+        if not records:
+            raise OSError(f'DoH lookup for {hostname} returned no A records')
+        return records[0]['data'], min(int(a.get('TTL', _ttl())) for a in records)
+
+    try:
+        return _cached(('doh', hostname.lower()), resolver)
+    except OSError:
+        return None
+
+
+def stats():
+    with _lock:
+        return dict(_stats, entries=len(_entries))
+
+
+def install():
+    """Route urllib3 (and so `requests`) connections through the cache.
+
+    urllib3 opens sockets via urllib3.util.connection.create_connection; the
+    wrapper resolves the host here and hands the original function a numeric
+    address. TLS still uses the original hostname for SNI and certificate
+    checks, since that is configured on the connection, not the socket.
+    """
+    try:
+        from urllib3.util import connection
+    except ImportError:
+        return
+    if getattr(connection.create_connection, '_dns_cached', False):
+        return
+    original = connection.create_connection
+
+    def create_connection(address, *args, **kwargs):
+        host, port = address
+        host = host.strip('[]') if host.startswith('[') else host
+        try:
+            infos = resolve(host, port, connection.allowed_gai_family(), socket.SOCK_STREAM)
+        except socket.gaierror:
+            raise
+        except Exception:
+            logger.exception('DNS cache lookup for %s failed; using system resolver', host)
+            return original(address, *args, **kwargs)
+        err = None
+        for _family, _type, _proto, _canonname, sockaddr in infos:
+            try:
+                return original((sockaddr[0], port), *args, **kwargs)
+            except OSError as e:
+                err = e
+        if err is not None:
+            raise err
+        raise OSError(f'getaddrinfo returned an empty list for {host}')
+
+    create_connection._dns_cached = True
+    connection.create_connection = create_connection
@@ -7,10 +7,12 @@ from .status import status_bp
 from .invocations import invocations_bp
 from .simulator import simulator_bp
 from .devices import devices_bp
+from .artwork import artwork_bp
 
 __all__ = [
     'status_bp',
     'invocations_bp',
     'simulator_bp',
     'devices_bp',
+    'artwork_bp',
 ]
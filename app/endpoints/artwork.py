@@ -0,0 +1,22 @@
+from flask import Blueprint, jsonify, request, send_file
+
+import artwork_cache
+
+artwork_bp = Blueprint('artwork_bp', __name__)
+
+# Variant files never change for a key (the key is derived from the source URL).
+_MAX_AGE = 365 * 24 * 3600
+
+
+@artwork_bp.route('/artwork/<key>/<variant>', methods=['GET'])
+def artwork(key, variant):
+    """Serve a resized variant of registered cover art (exempt from basic auth)."""
+    entry = artwork_cache.get(key, variant)
+    if entry is None:
+        return jsonify({'error': 'Unknown artwork'}), 404
+    path, etag, mimetype = entry
+    resp = send_file(path, mimetype=mimetype, etag=False, conditional=False, max_age=_MAX_AGE)
+    resp.set_etag(etag)
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp.make_conditional(request)
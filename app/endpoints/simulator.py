@@ -6,6 +6,8 @@ from copy import deepcopy
 import requests
 import urllib.parse
 
+import dns_cache
+
 simulator_bp = Blueprint('simulator_bp', __name__)
 
 
@@ -88,21 +90,11 @@ def simulator_payload():
 
 
 def _resolve_doh(hostname):
-    """Resolve hostname using DNS-over-HTTPS (Cloudflare) to bypass local /etc/hosts."""
-    try:
-        # Use Cloudflare DoH JSON endpoint
-        resp = requests.get('https://cloudflare-dns.com/dns-query', params={'name': hostname, 'type': 'A'}, headers={'Accept': 'application/dns-json'}, timeout=5)
-        if resp.ok:
-            j = resp.json()
-            answers = j.get('Answer') or []
-            for a in answers:
-                # Answer entries may contain 'data' with IP or CNAMEs
-                ip = a.get('data')
-                if ip and isinstance(ip, str):
-                    return ip
-    except Exception:
-        pass
-    return None
+    """Resolve hostname using DNS-over-HTTPS (Cloudflare) to bypass local /etc/hosts.
+
+    Answers are cached (respecting their TTL) in the shared dns_cache.
+    """
+    return dns_cache.resolve_doh(hostname)
 
 
 @simulator_bp.route('/simulator/send', methods=['POST'])
@@ -12,6 +12,12 @@ from requests.exceptions import RequestException
 from env_secrets import get_env_secret
 from pathlib import Path
 from setup_helpers import has_functional_cli_config
+import artwork_cache
+import dns_cache
+import latency
+import push_coalescer
+import singleflight
+import sse_broker
 
 status_bp = Blueprint('status_bp', __name__)
 
@@ -124,7 +130,8 @@ def _build_status_json():
     endpoint_url = request.host_url.rstrip('/') + '/ma/latest-url'
     try:
         auth = (api_user, api_pass) if api_user and api_pass else None
-        resp = requests.get(endpoint_url, timeout=2, auth=auth)
+        with latency.measure('status', endpoint_url):
+            resp = requests.get(endpoint_url, timeout=latency.timeout_for('status', endpoint_url), auth=auth)
         try:
             content_text = resp.content.decode('utf-8', errors='replace')
         except Exception:
@@ -154,7 +161,8 @@ def _build_status_json():
     alexa_endpoint = request.host_url.rstrip('/') + '/alexa/latest-url'
     try:
         auth = (api_user, api_pass) if api_user and api_pass else None
-        resp = requests.get(alexa_endpoint, timeout=2, auth=auth)
+        with latency.measure('status', alexa_endpoint):
+            resp = requests.get(alexa_endpoint, timeout=latency.timeout_for('status', alexa_endpoint), auth=auth)
         try:
             content_text = resp.content.decode('utf-8', errors='replace')
         except Exception:
@@ -219,7 +227,8 @@ def _compute_ma_api_html(api_user=None, api_pass=None):
     endpoint_url = (request.host_url.rstrip('/') if request else '') + '/ma/latest-url'
     try:
         auth = (api_user, api_pass) if api_user and api_pass else None
-        resp = requests.get(endpoint_url, timeout=2, auth=auth)
+        with latency.measure('status', endpoint_url):
+            resp = requests.get(endpoint_url, timeout=latency.timeout_for('status', endpoint_url), auth=auth)
         try:
             content_text = resp.content.decode('utf-8', errors='replace')
         except Exception:
@@ -252,7 +261,8 @@ def _compute_alexa_api_html(api_user=None, api_pass=None):
     alexa_endpoint = (request.host_url.rstrip('/') if request else '') + '/alexa/latest-url'
     try:
         auth = (api_user, api_pass) if api_user and api_pass else None
-        resp = requests.get(alexa_endpoint, timeout=2, auth=auth)
+        with latency.measure('status', alexa_endpoint):
+            resp = requests.get(alexa_endpoint, timeout=latency.timeout_for('status', alexa_endpoint), auth=auth)
         try:
             content_text = resp.content.decode('utf-8', errors='replace')
         except Exception:
@@ -293,21 +303,10 @@ def _compute_metadata_html():
     """Compute HTML showing the current APL metadata being sent in refreshes."""
     try:
         from skill import data as skill_data
-        from skill.util import get_ma_hostname, replace_ip_in_url
-        
+
+        # Image URLs were already made public when the record was pushed.
         metadata_info = dict(skill_data.info)  # Create a copy
-        
-        # Apply MA_HOSTNAME replacement to image URLs for display
-        try:
-            hostname = get_ma_hostname(raise_on_http_scheme=False)
-            if hostname:
-                if metadata_info.get('coverImageSource'):
-                    metadata_info['coverImageSource'] = replace_ip_in_url(metadata_info['coverImageSource'], hostname)
-                if metadata_info.get('backgroundImageSource'):
-                    metadata_info['backgroundImageSource'] = replace_ip_in_url(metadata_info['backgroundImageSource'], hostname)
-        except Exception:
-            pass  # If hostname replacement fails, show original URLs
-        
+
         pretty_metadata = json.dumps(metadata_info, indent=2, ensure_ascii=False)
         content_preview = escape(pretty_metadata)
         
@@ -347,6 +346,7 @@ def status():
         tpl = tpl.replace('__MA_API_HTML__', '<span class="muted">Checking Music Assistant API...</span>')
         tpl = tpl.replace('__ALEXA_API_HTML__', '<span class="muted">Checking Alexa API...</span>')
         tpl = tpl.replace('__METADATA_HTML__', '<span class="muted">Loading APL metadata...</span>')
+        tpl = tpl.replace('__PERF_HTML__', '<span class="muted">Loading performance counters...</span>')
         intent_logs = current_app.config.get('INTENT_LOGS', [])
         count = len(intent_logs) if intent_logs else 0
         if count:
@@ -392,3 +392,34 @@ def status_invocations():
     else:
         invocations_html = '<span class="muted">No recent invocations</span>'
     return jsonify({'count': count, 'invocations_html': invocations_html})
+
+
+def _compute_perf_html(perf):
+    """Render the performance counters as a status-page row."""
+    pretty = json.dumps(perf, indent=2, ensure_ascii=False, sort_keys=True)
+    return (
+        f'<span class="led green"></span> Performance (learned timeouts, shared calls)'
+        f"<pre class='status-box' tabindex='0' style='white-space:pre-wrap;background:#f6f6f6;padding:8px;border-radius:4px;max-height:200px;overflow:auto;user-select:text'>"
+        f"{escape(pretty)}</pre>"
+    )
+
+
+@status_bp.route('/status/perf', methods=['GET'])
+def status_perf():
+    """Return in-process performance counters and learned outbound timeouts."""
+    from skill import apl as skill_apl, fast_refresh, queue_view, refresh_schedule
+    perf = {
+        'singleflight': singleflight.stats(),
+        'latency': latency.snapshot(),
+        'dns_cache': dns_cache.stats(),
+        'ma_pushes': push_coalescer.stats(),
+        'ma_events': sse_broker.stats(),
+        'apl_directive_cache': skill_apl.directive_cache_stats(),
+        'apl_document_bytes': skill_apl.document_sizes(),
+        'apl_refresh': refresh_schedule.stats(),
+        'apl_fast_refresh': fast_refresh.stats(),
+        'apl_set_values': skill_apl.set_value_stats(),
+        'artwork': artwork_cache.stats(),
+        'apl_queue_pages': queue_view.stats(),
+    }
+    return jsonify(dict(perf, perf_html=_compute_perf_html(perf)))
@@ -0,0 +1,31 @@
+"""Numeric tunables read from the environment.
+
+All performance settings (timeouts, TTLs, limits) are read through these
+helpers so they validate the same way: an unset, empty, unparsable or
+non-finite value falls back to the default, and the result is clamped to
+at least `minimum`. Settings are read on every use, so changing the
+environment (add-on options, tests) takes effect without a restart.
+"""
+
+import math
+import os
+
+
+def float_env(name, default, minimum=0.0):
+    """Return the float setting `name`, or `default`, and at least `minimum`."""
+    try:
+        value = float(os.environ.get(name) or default)
+    except ValueError:
+        value = float(default)
+    if not math.isfinite(value):
+        value = float(default)
+    return max(value, minimum)
+
+
+def int_env(name, default, minimum=1):
+    """Return the integer setting `name`, or `default`, and at least `minimum`."""
+    try:
+        value = int(os.environ.get(name) or default)
+    except ValueError:
+        value = int(default)
+    return max(value, minimum)
@@ -0,0 +1,53 @@
+"""In-process publish/subscribe for metadata updates.
+
+The skill, the /ma API and the /alexa API run in one process (mounted by
+app.py), so they hand updates to each other with a function call instead
+of POSTing to localhost. Subscribers are called synchronously in the
+publishing thread, in subscription order; they should return quickly and
+must not block. An exception in one subscriber is logged and does not
+stop delivery to the others.
+
+Events only reach subscribers in the same process. With the SQLite store
+backend and several workers, a push handled by one worker is visible to
+the others through the store, not through this bus.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# shared_store published a new NowPlaying snapshot (payload: the snapshot).
+NOW_PLAYING = 'now_playing'
+# The skill handed a stream to an Echo (payload: the /alexa/latest-url dict).
+ALEXA_NOW_PLAYING = 'alexa_now_playing'
+
+_lock = threading.Lock()
+# topic -> tuple of callbacks; replaced on (un)subscribe, read without the lock.
+_subscribers = {}
+
+
+def subscribe(topic, callback):
+    """Call callback(payload) for every event on topic; return an unsubscribe function."""
+    with _lock:
+        _subscribers[topic] = _subscribers.get(topic, ()) + (callback,)
+
+    def unsubscribe():
+        with _lock:
+            callbacks = list(_subscribers.get(topic, ()))
+            if callback in callbacks:
+                callbacks.remove(callback)
+                _subscribers[topic] = tuple(callbacks)
+
+    return unsubscribe
+
+
+def publish(topic, payload):
+    """Deliver payload to the topic's subscribers; return how many were called."""
+    callbacks = _subscribers.get(topic, ())
+    for callback in callbacks:
+        try:
+            callback(payload)
+        except Exception:
+            logger.exception('Subscriber %r failed for %s event', callback, topic)
+    return len(callbacks)
@@ -0,0 +1,134 @@
+"""Per-host latency tracking and adaptive outbound timeouts.
+
+Outbound calls (stream URL probes, MA commands, metadata fetches) used to
+hardcode their timeouts. Instead, each call kind records how long the
+target host actually takes, as an EWMA plus a p99 over a sliding window of
+recent samples, and asks for a timeout of ADAPTIVE_TIMEOUT_MULTIPLIER times
+the observed latency, clamped to a per-kind floor and ceiling (overridable
+per kind with ADAPTIVE_TIMEOUT_<KIND>_FLOOR_SECONDS and
+ADAPTIVE_TIMEOUT_<KIND>_CEILING_SECONDS). Until enough samples exist the
+ceiling (the previous hardcoded value) is used.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from env import float_env
+
+# kind -> (floor seconds, ceiling seconds). Ceilings are the timeouts these
+# calls used before they became adaptive.
+_BOUNDS = {
+    'stream_probe': (1.0, 5.0),
+    'ma_command': (2.0, 10.0),
+    'metadata': (0.5, 5.0),
+    'status': (0.5, 2.0),
+    'artwork': (2.0, 10.0),
+}
+_DEFAULT_BOUNDS = (1.0, 5.0)
+# Overridden floors below this would make every call time out at once.
+_MIN_TIMEOUT = 0.1
+
+_EWMA_ALPHA = 0.2
+_WINDOW = 200
+_MIN_SAMPLES = 5
+
+_lock = threading.Lock()
+_trackers = {}
+
+
+def _multiplier():
+    return float_env('ADAPTIVE_TIMEOUT_MULTIPLIER', 4, minimum=1.0)
+
+
+def _bounds(kind):
+    floor, ceiling = _BOUNDS.get(kind, _DEFAULT_BOUNDS)
+    floor = float_env(f'ADAPTIVE_TIMEOUT_{kind.upper()}_FLOOR_SECONDS', floor, minimum=_MIN_TIMEOUT)
+    ceiling = float_env(f'ADAPTIVE_TIMEOUT_{kind.upper()}_CEILING_SECONDS', ceiling, minimum=floor)
+    return floor, ceiling
+
+
+def host_of(url_or_host):
+    if not url_or_host:
+        return ''
+    if '://' not in url_or_host:
+        return url_or_host.lower()
+    try:
+        return (urlparse(url_or_host).hostname or '').lower()
+    except ValueError:
+        return ''
+
+
+class _Tracker:
+    __slots__ = ('ewma', 'samples', 'count', '_p99')
+
+    def __init__(self):
+        self.ewma = None
+        self.samples = deque(maxlen=_WINDOW)
+        self.count = 0
+        self._p99 = None
+
+    def add(self, seconds):
+        self.ewma = seconds if self.ewma is None else (
+            _EWMA_ALPHA * seconds + (1 - _EWMA_ALPHA) * self.ewma)
+        self.samples.append(seconds)
+        self.count += 1
+        self._p99 = None
+
+    def p99(self):
+        if self._p99 is None and self.samples:
+            ordered = sorted(self.samples)
+            self._p99 = ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)]
+        return self._p99
+
+
+def observe(kind, url_or_host, seconds):
+    """Record one observed latency (seconds) for kind/host."""
+    key = (kind, host_of(url_or_host))
+    with _lock:
+        tracker = _trackers.get(key)
+        if tracker is None:
+            tracker = _trackers[key] = _Tracker()
+        tracker.add(seconds)
+
+
+def timeout_for(kind, url_or_host):
+    """Return the timeout (seconds) to use for a call of `kind` to this host."""
+    floor, ceiling = _bounds(kind)
+    with _lock:
+        tracker = _trackers.get((kind, host_of(url_or_host)))
+        if tracker is None or tracker.count < _MIN_SAMPLES:
+            return ceiling
+        observed = max(tracker.ewma, tracker.p99())
+    return min(max(observed * _multiplier(), floor), ceiling)
+
+
+@contextmanager
+def measure(kind, url_or_host):
+    """Time the enclosed call and record it, including failed/timed-out ones.
+
+    A timed-out call is recorded at its full duration so the learned
+    timeout grows back instead of staying too tight for a slowed host.
+    """
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(kind, url_or_host, time.monotonic() - started)
+
+
+def snapshot():
+    """Return learned latencies and current timeouts per kind/host."""
+    with _lock:
+        items = [(kind, host, t.count, t.ewma, t.p99()) for (kind, host), t in _trackers.items()]
+    out = {}
+    for kind, host, count, ewma, p99 in sorted(items):
+        out.setdefault(kind, {})[host or '(none)'] = {
+            'samples': count,
+            'ewma_ms': round(ewma * 1000, 1),
+            'p99_ms': round(p99 * 1000, 1),
+            'timeout_s': round(timeout_for(kind, host), 3),
+        }
+    return out
@@ -0,0 +1,94 @@
+"""Long-poll support for the latest-url endpoints.
+
+`GET .../latest-url?wait=<seconds>&since=<version>` blocks until a record
+newer than `since` exists (or `wait` runs out, capped at
+LONG_POLL_MAX_SECONDS) and then answers like a normal GET. Without
+`since`, an If-None-Match header naming the current record waits for the
+next one (any other tag is answered at once). Waiters sleep on
+a condition variable that is notified from the event bus, so an
+in-process publish wakes them immediately; the condition is also
+re-checked every second for records published by other workers (SQLite
+store backend).
+"""
+
+import math
+import threading
+import time
+
+import event_bus
+from env import float_env
+
+_RECHECK_SECONDS = 1.0
+
+
+def _max_wait():
+    return float_env('LONG_POLL_MAX_SECONDS', 30)
+
+
+class Waiter:
+    """Wakes long-poll requests whenever an event is published on `topic`."""
+
+    def __init__(self, topic):
+        self._cond = threading.Condition()
+        self.waiting = 0
+        event_bus.subscribe(topic, self._notify)
+
+    def _notify(self, _payload):
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait_for(self, predicate, timeout):
+        """Block until predicate() is true or timeout passes; return its last value."""
+        if not math.isfinite(timeout):
+            timeout = 0.0
+        deadline = time.monotonic() + min(max(timeout, 0.0), _max_wait())
+        with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    result = predicate()
+                    remaining = deadline - time.monotonic()
+                    # Written so that a NaN remaining also ends the wait.
+                    if result or not remaining > 0:
+                        return result
+                    self._cond.wait(min(remaining, _RECHECK_SECONDS))
+            finally:
+                self.waiting -= 1
+
+
+def params(request, etag_version):
+    """Return (wait_seconds, since_version) from the request, or (0, None) for a plain GET.
+
+    etag_version maps an If-None-Match entity tag to the version it was
+    served for (None if unknown).
+    """
+    try:
+        wait = float(request.args.get('wait', 0))
+    except (ValueError, OverflowError):
+        wait = 0.0
+    # nan and inf would defeat the clamping below (NaN compares false to everything).
+    if not math.isfinite(wait):
+        wait = 0.0
+    wait = min(max(wait, 0.0), _max_wait())
+    if not wait:
+        return 0.0, None
+    since = request.args.get('since', type=int)
+    if since is None:
+        for etag in request.if_none_match.as_set():
+            since = etag_version(etag)
+            if since is not None:
+                break
+    return wait, since
+
+
+def wait_newer(waiter, request, current_version, etag_version):
+    """Hold the request per its wait/since parameters until current_version() > since."""
+    wait, since = params(request, etag_version)
+    if not wait or since is None:
+        return
+
+    def newer():
+        version = current_version()
+        return version is not None and version > since
+
+    waiter.wait_for(newer, wait)
@@ -1,10 +1,30 @@
 """Route definitions for music_assistant_api (ma_routes)."""
 
-from flask import jsonify, request
+from flask import Response, jsonify, request
+import hashlib
+import json
 import os
 import time
 from urllib.parse import urlparse, urlunparse
+import artwork_cache
+import long_poll
+import push_coalescer
 import shared_store
+import sse_broker
+from event_bus import NOW_PLAYING
+
+_waiter = long_poll.Waiter(NOW_PLAYING)
+
+
+def _etag(store):
+    """Entity tag for a record: its version plus a digest of its content.
+
+    The version alone is not enough: the counter starts over when the store
+    comes up empty (no saved state), and the same number then names
+    different content.
+    """
+    body = json.dumps(store.to_dict(), sort_keys=True).encode()
+    return f"{store.version}-{hashlib.sha1(body).hexdigest()[:16]}"
 
 
 def _rewrite_url(url: str) -> str:
@@ -27,6 +47,15 @@ def _rewrite_url(url: str) -> str:
         return url
 
 
+def _seconds(value):
+    """Parse an optional non-negative number of seconds from the push body."""
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    return seconds if seconds >= 0 else None
+
+
 def register_routes(bp):
     @bp.route('/push-url', methods=['POST'])
     def push_url():
@@ -36,22 +65,66 @@ def register_routes(bp):
             return jsonify({'error': 'Missing required fields'}), 400
 
         stream_url = _rewrite_url(stream_url)
-        image_url = _rewrite_url(data.get('imageUrl'))
-
-        shared_store._version += 1
-        shared_store._store = {
-            'streamUrl': stream_url,
-            'title': data.get('title'),
-            'artist': data.get('artist'),
-            'album': data.get('album'),
-            'imageUrl': image_url,
-            'version': shared_store._version,
-            'timestamp': time.time()
-        }
-        return jsonify({'status': 'ok', 'version': shared_store._version})
+        # Echo devices get resized artwork from /artwork when the proxy is
+        # enabled; it is registered once the coalescer applies the record.
+        image_url = artwork_cache.offer(data.get('imageUrl'), _rewrite_url(data.get('imageUrl')))
+        player_id = data.get('playerId') or data.get('player_id') or None
+
+        record = shared_store.NowPlaying(
+            stream_url=stream_url,
+            title=data.get('title') or '',
+            artist=data.get('artist') or '',
+            album=data.get('album') or '',
+            image_url=image_url or '',
+            timestamp=time.time(),
+            duration=_seconds(data.get('duration')),
+            elapsed=_seconds(data.get('elapsed'))
+        )
+        outcome, version = push_coalescer.submit(record, player_id=player_id, source=request.remote_addr)
+        if outcome == push_coalescer.RATE_LIMITED:
+            return jsonify({'error': 'Too many pushes'}), 429
+        if outcome == push_coalescer.ACCEPTED:
+            return jsonify({'status': 'ok', 'version': version})
+        return jsonify({'status': outcome, 'version': version})
 
     @bp.route('/latest-url', methods=['GET'])
     def latest_url():
-        if not shared_store._store:
+        player_id = request.args.get('playerId') or None
+
+        def current_version():
+            store = shared_store.get_latest(player_id)
+            return store.version if store else None
+
+        def etag_version(etag):
+            # Only the current record's tag can be waited on; any other means
+            # the client is behind (or the tag predates a restart).
+            store = shared_store.get_latest(player_id)
+            return store.version if store and etag == _etag(store) else None
+
+        long_poll.wait_newer(_waiter, request, current_version, etag_version)
+        store = shared_store.get_latest(player_id)
+        if not store:
             return jsonify({'error': 'No URL available'}), 404
-        return jsonify(shared_store._store)
+        resp = jsonify(store.to_dict())
+        resp.set_etag(_etag(store))
+        return resp.make_conditional(request)
+
+    @bp.route('/events', methods=['GET'])
+    def events():
+        # Flask answers HEAD for GET routes; a stream is only opened for GET.
+        if request.method != 'GET':
+            return jsonify({'error': 'Method not allowed'}), 405, {'Allow': 'GET'}
+        player_id = request.args.get('playerId') or None
+        last_event_id = request.headers.get('Last-Event-ID', request.args.get('lastEventId'))
+        try:
+            last_event_id = int(last_event_id) if last_event_id is not None else None
+        except ValueError:
+            last_event_id = None
+        stream = sse_broker.open_stream(player_id, last_event_id)
+        if stream is None:
+            return jsonify({'error': 'Too many event stream subscribers'}), 503
+        return Response(stream, mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            # Keep reverse proxies (nginx) from buffering the stream.
+            'X-Accel-Buffering': 'no',
+        })
@@ -0,0 +1,209 @@
+"""Coalescing and rate limiting for /ma/push-url.
+
+Seeking, queue edits and flow-mode transitions can make MA push several
+updates a second. Every push that reaches shared_store bumps the version,
+and every APL refresh then resends metadata. Pushes pass through here first:
+
+- a push whose content equals the last applied (or already staged) one for
+  the same player is dropped (a position that just advanced with the clock
+  is not a change; a seek is);
+- the first push after a quiet period is applied at once (leading edge);
+  later pushes within PUSH_COALESCE_WINDOW_SECONDS are staged and only the
+  last of them is applied when the window closes (trailing edge);
+- each source address has a token bucket of PUSH_RATE_LIMIT_PER_SECOND
+  (burst PUSH_RATE_LIMIT_BURST); pushes beyond it are rejected.
+
+Counters per outcome are shown on the status page.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import shared_store
+from env import float_env
+
+logger = logging.getLogger(__name__)
+
+ACCEPTED = 'accepted'
+COALESCED = 'coalesced'
+UNCHANGED = 'unchanged'
+RATE_LIMITED = 'rate_limited'
+
+_BUCKETS_MAX = 256
+_SLOTS_MAX = 256
+# Seconds a reported position may drift from the expected one before it counts as a seek.
+_SEEK_TOLERANCE = 2.0
+
+_lock = threading.Lock()
+# Serialises store writes. Pushes are sequenced per slot under _lock, but
+# applied after it is released, so a write that lost the race to a later
+# decision for its slot (say a trailing flush overtaking the leading push
+# it followed) is dropped instead of overwriting the newer record.
+_apply_lock = threading.Lock()
+# player id -> _Slot, least recently pushed first.
+_slots = OrderedDict()
+_buckets = OrderedDict()
+_stats = {'received': 0, ACCEPTED: 0, COALESCED: 0, UNCHANGED: 0, RATE_LIMITED: 0}
+
+
+def _window():
+    return float_env('PUSH_COALESCE_WINDOW_SECONDS', 0.5)
+
+
+class _Slot:
+    __slots__ = ('applied', 'staged', 'version', 'window_ends', 'timer', 'seq', 'published_seq')
+
+    def __init__(self):
+        self.applied = None
+        self.staged = None
+        self.version = None
+        self.window_ends = 0.0
+        self.timer = None
+        # Sequence number of the last push chosen for applying, and of the last one applied.
+        self.seq = 0
+        self.published_seq = 0
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+
+
+def _content(record):
+    return (record.stream_url, record.title, record.artist, record.album, record.image_url, record.duration)
+
+
+def _same(current, record):
+    """True if record carries nothing new: same track, and no seek since current."""
+    if _content(current) != _content(record):
+        return False
+    if current.elapsed is None or record.elapsed is None or None in (current.timestamp, record.timestamp):
+        return current.elapsed == record.elapsed or record.elapsed is None
+    # Progress updates are expected to advance with the clock; a jump is a seek.
+    expected = current.elapsed + (record.timestamp - current.timestamp)
+    return abs(record.elapsed - expected) < _SEEK_TOLERANCE
+
+
+def _take_token(source, now):
+    rate = float_env('PUSH_RATE_LIMIT_PER_SECOND', 20)
+    if not rate:
+        return True
+    burst = float_env('PUSH_RATE_LIMIT_BURST', 40, minimum=1.0)
+    bucket = _buckets.pop(source, None)
+    if bucket is None:
+        bucket = _Bucket(burst, now)
+    else:
+        bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+        bucket.updated = now
+    _buckets[source] = bucket
+    while len(_buckets) > _BUCKETS_MAX:
+        _buckets.popitem(last=False)
+    if bucket.tokens < 1:
+        return False
+    bucket.tokens -= 1
+    return True
+
+
+def _evict_slots():
+    """Drop the least recently pushed idle slots beyond _SLOTS_MAX (one with a staged push is kept)."""
+    excess = len(_slots) - _SLOTS_MAX
+    if excess <= 0:
+        return
+    idle = [key for key, slot in _slots.items() if slot.staged is None][:excess]
+    for key in idle:
+        del _slots[key]
+
+
+def _publish(slot, record, player_id, seq):
+    """Apply the push chosen as seq; return its store version, or None if a later one was applied first."""
+    with _apply_lock:
+        if seq < slot.published_seq:
+            with _lock:
+                _stats[ACCEPTED] -= 1
+                _stats[COALESCED] += 1
+            return None
+        version = shared_store.publish(record, player_id=player_id)
+        with _lock:
+            slot.version = version
+            slot.published_seq = seq
+    return version
+
+
+def _flush(key, player_id):
+    with _lock:
+        slot = _slots.get(key)
+        if slot is None:
+            return
+        record, slot.staged, slot.timer = slot.staged, None, None
+        if record is None:
+            return
+        slot.applied = record
+        slot.seq += 1
+        seq = slot.seq
+        # Keep coalescing while the storm lasts.
+        slot.window_ends = time.monotonic() + _window()
+        _stats[ACCEPTED] += 1
+    try:
+        _publish(slot, record, player_id, seq)
+    except Exception:
+        logger.exception('Failed to apply coalesced push for player %s', player_id)
+
+
+def submit(record, player_id=None, source=None):
+    """Offer a NowPlaying push; return (outcome, version).
+
+    version is the store version the push was applied as (ACCEPTED), or
+    the current one (UNCHANGED); None when the push was staged, superseded
+    by a later push before it could be applied (COALESCED) or rejected.
+    """
+    key = player_id or ''
+    now = time.monotonic()
+    with _lock:
+        _stats['received'] += 1
+        if not _take_token(source, now):
+            _stats[RATE_LIMITED] += 1
+            return RATE_LIMITED, None
+
+        slot = _slots.pop(key, None) or _Slot()
+        _slots[key] = slot
+        _evict_slots()
+        current = slot.staged if slot.staged is not None else slot.applied
+        if current is not None and _same(current, record):
+            _stats[UNCHANGED] += 1
+            return UNCHANGED, slot.version
+
+        if now < slot.window_ends:
+            if slot.staged is not None:
+                _stats[COALESCED] += 1
+            slot.staged = record
+            if slot.timer is None:
+                slot.timer = threading.Timer(slot.window_ends - now, _flush, args=(key, player_id))
+                slot.timer.daemon = True
+                slot.timer.start()
+            return COALESCED, None
+
+        slot.applied = record
+        slot.seq += 1
+        seq = slot.seq
+        slot.window_ends = now + _window()
+        _stats[ACCEPTED] += 1
+    version = _publish(slot, record, player_id, seq)
+    if version is None:
+        return COALESCED, None
+    return ACCEPTED, version
+
+
+def stats():
+    """Return push counters.
+
+    'coalesced' counts pushes superseded by a later one before they were
+    applied; 'staged' pushes are still waiting for their window to close.
+    """
+    with _lock:
+        staged = sum(1 for slot in _slots.values() if slot.staged is not None)
+        return dict(_stats, staged=staged)
@@ -1,4 +1,417 @@
-"""Shared store for MA and Alexa routes."""
+"""Shared store for MA and Alexa routes.
 
-_store = None
-_version = 0
+Records pushed by Music Assistant are kept per MA player id, so several
+players pushing to /ma/push-url no longer overwrite each other. A "latest"
+slot holds the most recent record from any player; it is what pushes
+without a player id update and what lookups without a player id read
+(unmapped devices). A player that has not pushed yet has no record of its
+own and does not borrow another room's, unless no push has carried a
+player id at all (MA versions that do not send one).
+
+The backing store is chosen by SHARED_STORE_BACKEND:
+
+- ``memory`` (default): module state, for the usual single-process server.
+- ``sqlite``: a SQLite database in WAL mode at SHARED_STORE_PATH, for
+  multi-worker WSGI servers. A push handled by one worker is visible to
+  requests on every other worker; readers never block on the writer.
+
+Records are immutable NowPlaying snapshots. A publish builds a new
+snapshot and swaps it in with a single reference assignment, so readers
+take no lock and can never observe a half-written record. Everything the
+skill derives from a record (playable URL, secondary text, the info/APL
+field maps) is computed once when the snapshot is built, not per read.
+
+So that a restart does not leave the skill without a stream until MA
+pushes again, the in-memory records, the version counter and recent
+stream URL validation results are written to NOW_PLAYING_STATE_PATH
+(batched, off the request path) and loaded back at import.
+"""
+
+import atexit
+import dataclasses
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Optional
+
+import artwork_cache
+import event_bus
+from env import float_env
+
+logger = logging.getLogger(__name__)
+
+_LATEST_KEY = ''
+_DEFAULT_SQLITE_PATH = '/app/instance_data/shared_store.sqlite3'
+_DEFAULT_STATE_PATH = '/app/instance_data/now_playing.json'
+# Pushes arriving within this many seconds are written to disk together.
+_STATE_WRITE_DELAY = 1.0
+_VALIDATIONS_MAX = 16
+# Alexa's AudioPlayer cannot play FLAC; MA serves the same stream as MP3.
+_FLAC_EXTENSION = re.compile(r'(?i)\.flac(?=$|\?)')
+
+
+def _secondary_text(artist, album):
+    if artist and album:
+        return f"{artist} - {album}"
+    return artist or album
+
+
+@dataclass(frozen=True, slots=True)
+class NowPlaying:
+    """One pushed now-playing record. Never modified once published."""
+
+    stream_url: str
+    title: str = ''
+    artist: str = ''
+    album: str = ''
+    image_url: str = ''
+    timestamp: Optional[float] = None
+    version: Optional[int] = None
+    player_id: Optional[str] = None
+    # Track length and playback position in seconds, when MA reports them;
+    # elapsed is the position at `timestamp`.
+    duration: Optional[float] = None
+    elapsed: Optional[float] = None
+
+    # Derived in __post_init__; URLs are expected to be public already
+    # (ma_routes rewrites them to MA_HOSTNAME before publishing).
+    play_url: str = field(init=False, repr=False, compare=False)
+    secondary_text: str = field(init=False, repr=False, compare=False)
+    info: MappingProxyType = field(init=False, repr=False, compare=False)
+    apl_fields: MappingProxyType = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        play_url = _FLAC_EXTENSION.sub('.mp3', self.stream_url).replace(' ', '%20')
+        image = self.image_url.replace(' ', '%20')
+        secondary = _secondary_text(self.artist, self.album)
+        fields = {
+            'audioSources': play_url,
+            'backgroundImageSource': artwork_cache.variant_url(image, 'background'),
+            'coverImageSource': image,
+            'headerAttributionImage': '',
+            'headerTitle': '',
+            'headerSubtitle': '',
+            'primaryText': self.title,
+            'secondaryText': secondary,
+        }
+        object.__setattr__(self, 'play_url', play_url)
+        object.__setattr__(self, 'secondary_text', secondary)
+        # `info` is what the AudioPlayer path plays; the APL Video component
+        # is given the stream URL as pushed.
+        object.__setattr__(self, 'info', MappingProxyType(fields))
+        object.__setattr__(self, 'apl_fields', MappingProxyType(dict(fields, audioSources=self.stream_url)))
+
+    def remaining(self, now):
+        """Seconds left in the track at wall-clock time `now`, or None if unknown."""
+        if self.duration is None or self.elapsed is None or self.timestamp is None:
+            return None
+        return self.duration - self.elapsed - (now - self.timestamp)
+
+    @classmethod
+    def from_dict(cls, record):
+        """Build a snapshot from the /ma/latest-url JSON shape."""
+        return cls(
+            stream_url=record.get('streamUrl') or '',
+            title=record.get('title') or '',
+            artist=record.get('artist') or '',
+            album=record.get('album') or '',
+            image_url=record.get('imageUrl') or '',
+            timestamp=record.get('timestamp'),
+            version=record.get('version'),
+            player_id=record.get('playerId'),
+            duration=record.get('duration'),
+            elapsed=record.get('elapsed'),
+        )
+
+    def to_dict(self):
+        """Return the /ma/latest-url JSON shape."""
+        return {
+            'streamUrl': self.stream_url,
+            'title': self.title,
+            'artist': self.artist,
+            'album': self.album,
+            'imageUrl': self.image_url,
+            'timestamp': self.timestamp,
+            'version': self.version,
+            'playerId': self.player_id,
+            'duration': self.duration,
+            'elapsed': self.elapsed,
+        }
+
+
+def _as_now_playing(record):
+    return record if isinstance(record, NowPlaying) else NowPlaying.from_dict(record)
+
+
+class MemoryBackend:
+    """Process-local records; versions are unique within the process.
+
+    Writers serialise on a lock and replace the whole player -> snapshot
+    mapping; readers only dereference the current mapping.
+    """
+
+    def __init__(self):
+        self._records = {}
+        self._version = 0
+        self._write_lock = threading.Lock()
+
+    def publish(self, record, player_id=None):
+        with self._write_lock:
+            version = self._version + 1
+            snapshot = dataclasses.replace(_as_now_playing(record), version=version, player_id=player_id)
+            records = dict(self._records)
+            if player_id:
+                records[player_id] = snapshot
+            records[_LATEST_KEY] = snapshot
+            self._records = records
+            self._version = version
+            return snapshot
+
+    def restore(self, records, version):
+        with self._write_lock:
+            self._records = dict(records)
+            self._version = max(self._version, version)
+
+    def export(self):
+        with self._write_lock:
+            return self._version, self._records
+
+    def get(self, key):
+        return self._records.get(key)
+
+    def player_ids(self):
+        return sorted(k for k in self._records if k != _LATEST_KEY)
+
+
+class SQLiteBackend:
+    """Records in a WAL-mode SQLite file shared by all worker processes.
+
+    Version and records are written in one IMMEDIATE transaction, so the
+    version counter is global across workers and a record is never visible
+    without its version. Each thread reads through its own connection; the
+    JSON payload is only decoded when the stored version moves.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._decoded = {}
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS records ('
+                     'key TEXT PRIMARY KEY, version INTEGER NOT NULL, payload TEXT NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('version', 0)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly.
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def publish(self, record, player_id=None):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()[0] + 1
+            snapshot = dataclasses.replace(_as_now_playing(record), version=version, player_id=player_id)
+            payload = json.dumps(snapshot.to_dict())
+            conn.execute("UPDATE meta SET value = ? WHERE name = 'version'", (version,))
+            keys = [_LATEST_KEY] + ([player_id] if player_id else [])
+            conn.executemany('INSERT OR REPLACE INTO records (key, version, payload) VALUES (?, ?, ?)',
+                             [(key, version, payload) for key in keys])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return snapshot
+
+    def get(self, key):
+        row = self._conn().execute('SELECT version, payload FROM records WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        version, payload = row
+        cached = self._decoded.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        snapshot = NowPlaying.from_dict(json.loads(payload))
+        self._decoded[key] = (version, snapshot)
+        return snapshot
+
+    def player_ids(self):
+        rows = self._conn().execute('SELECT key FROM records WHERE key != ? ORDER BY key', (_LATEST_KEY,))
+        return [row[0] for row in rows]
+
+
+def _create_backend():
+    name = os.environ.get('SHARED_STORE_BACKEND', 'memory').strip().lower()
+    if name == 'sqlite':
+        path = os.environ.get('SHARED_STORE_PATH', _DEFAULT_SQLITE_PATH)
+        try:
+            return SQLiteBackend(path)
+        except (sqlite3.Error, OSError):
+            logger.exception('Could not open SQLite shared store at %s; using in-memory store', path)
+    elif name != 'memory':
+        logger.warning('Unknown SHARED_STORE_BACKEND %r; using in-memory store', name)
+    return MemoryBackend()
+
+
+_backend = _create_backend()
+
+# url -> (HTTP status, wall-clock time checked). Replaced, never mutated.
+_validations = {}
+_state_lock = threading.Lock()
+_state_write_lock = threading.Lock()
+_state_dirty = threading.Event()
+_state_thread = None
+
+
+def _state_path():
+    return os.environ.get('NOW_PLAYING_STATE_PATH', _DEFAULT_STATE_PATH)
+
+
+def _validation_ttl():
+    return float_env('STREAM_VALIDATION_TTL_SECONDS', 600)
+
+
+def _load_state():
+    global _validations
+    path = _state_path()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError):
+        logger.exception('Failed to read now-playing state from %s', path)
+        return
+    if not isinstance(state, dict):
+        return
+    try:
+        _validations = {url: (int(v['status']), float(v['checkedAt']))
+                        for url, v in (state.get('validations') or {}).items()}
+        records = {key: NowPlaying.from_dict(record)
+                   for key, record in (state.get('records') or {}).items()
+                   if isinstance(record, dict) and record.get('streamUrl')}
+        version = int(state.get('version') or 0)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        logger.exception('Ignoring malformed now-playing state in %s', path)
+        return
+    # The SQLite backend is durable by itself; only the memory one needs its records back.
+    if isinstance(_backend, MemoryBackend) and records:
+        _backend.restore(records, version)
+        logger.info('Restored now-playing state (version %s) from %s', version, path)
+
+
+def _write_state():
+    path = _state_path()
+    state = {'validations': {url: {'status': status, 'checkedAt': checked_at}
+                             for url, (status, checked_at) in _validations.items()}}
+    if isinstance(_backend, MemoryBackend):
+        version, records = _backend.export()
+        state['version'] = version
+        state['records'] = {key: record.to_dict() for key, record in records.items()}
+    with _state_write_lock:
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            # Unique per writer: several workers can share one state file.
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.exception('Failed to write now-playing state to %s', path)
+
+
+def _state_writer():
+    while True:
+        _state_dirty.wait()
+        time.sleep(_STATE_WRITE_DELAY)
+        _state_dirty.clear()
+        _write_state()
+
+
+def _mark_state_dirty():
+    global _state_thread
+    _state_dirty.set()
+    if _state_thread is None:
+        with _state_lock:
+            if _state_thread is None:
+                _state_thread = threading.Thread(target=_state_writer, name='store-state', daemon=True)
+                _state_thread.start()
+
+
+@atexit.register
+def flush_state():
+    """Write pending state now instead of waiting for the batching delay."""
+    if _state_dirty.is_set():
+        _state_dirty.clear()
+        _write_state()
+
+
+def publish(record, player_id=None):
+    """Store a new record (for player_id, if given); return its version.
+
+    `record` is a NowPlaying or a dict in the /ma/latest-url shape; its
+    version and player id are assigned here. Subscribers to
+    event_bus.NOW_PLAYING receive the stored snapshot.
+    """
+    snapshot = _backend.publish(record, player_id)
+    if isinstance(_backend, MemoryBackend):
+        _mark_state_dirty()
+    event_bus.publish(event_bus.NOW_PLAYING, snapshot)
+    return snapshot.version
+
+
+def record_validation(url, status):
+    """Remember that probing `url` returned HTTP `status` just now."""
+    global _validations
+    with _state_lock:
+        validations = dict(_validations)
+        validations[url] = (status, time.time())
+        while len(validations) > _VALIDATIONS_MAX:
+            del validations[min(validations, key=lambda u: validations[u][1])]
+        _validations = validations
+    _mark_state_dirty()
+
+
+def validated_status(url):
+    """Return the HTTP status recorded for `url` within the validation TTL, else None."""
+    entry = _validations.get(url)
+    if entry is None:
+        return None
+    status, checked_at = entry
+    if time.time() - checked_at > _validation_ttl():
+        return None
+    return status
+
+
+def get_latest(player_id=None):
+    """Return the latest NowPlaying for player_id, or None if that player has not pushed yet.
+
+    Without a player id (an unmapped device), or while no push has carried
+    one, this is the most recent record from any player.
+    """
+    store = _backend.get(player_id) if player_id else None
+    if store is None and (not player_id or not _backend.player_ids()):
+        store = _backend.get(_LATEST_KEY)
+    if store is not None and store.stream_url:
+        return store
+    return None
+
+
+def player_ids():
+    return _backend.player_ids()
+
+
+_load_state()
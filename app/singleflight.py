@@ -0,0 +1,73 @@
+"""In-process singleflight: collapse concurrent identical calls into one.
+
+When a multi-room group starts, several Echo devices send LaunchRequest at
+almost the same moment and each would repeat the same metadata fetch and
+stream URL probe. Callers asking for the same key while a call for it is
+already in flight wait for that call and share its result (or exception)
+instead of doing the work again. Nothing is cached once the call returns.
+
+Keys are tuples whose first element names the kind of call (e.g.
+``('stream_probe', url)``); counters are kept per kind for the status page.
+"""
+
+import threading
+
+_lock = threading.Lock()
+_calls = {}
+_stats = {}
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _kind_stats(key):
+    kind = key[0] if isinstance(key, tuple) and key else str(key)
+    stats = _stats.get(kind)
+    if stats is None:
+        stats = _stats[kind] = {'executed': 0, 'shared': 0, 'in_flight': 0, 'max_in_flight': 0}
+    return stats
+
+
+def do(key, fn, *args, **kwargs):
+    """Call fn(*args, **kwargs), or join an identical call already in flight."""
+    with _lock:
+        stats = _kind_stats(key)
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+            stats['executed'] += 1
+            stats['in_flight'] += 1
+            stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+        else:
+            stats['shared'] += 1
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = fn(*args, **kwargs)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _calls.pop(key, None)
+            stats['in_flight'] -= 1
+        call.done.set()
+
+
+def stats():
+    """Return a copy of the per-kind counters (executed/shared/in-flight)."""
+    with _lock:
+        return {kind: dict(values) for kind, values in _stats.items()}
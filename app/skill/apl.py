@@ -3,9 +3,14 @@
 import json
 import logging
 import os
+import re
 import sys
+import threading
+import uuid
+from collections import OrderedDict
 from ask_sdk_model.interfaces.alexa.presentation.apl import RenderDocumentDirective
 from ask_sdk_core.response_helper import ResponseFactory
+from ask_sdk_core.serialize import DefaultSerializer
 from . import data
 
 # Ensure /app/src is on the Python path so shared_store can be imported
@@ -13,126 +18,436 @@ _app_src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if _app_src not in sys.path:
     sys.path.insert(0, _app_src)
 
+import artwork_cache
+import event_bus
+import shared_store
 
-def _load_apl_template():
-    # type: () -> dict
-    """Load the APL document template from JSON file."""
-    template_path = os.path.join(os.path.dirname(__file__), 'apl_document.json')
-    with open(template_path, 'r') as f:
-        return json.load(f)
 
+_TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), 'apl_document.json')
+_template_lock = threading.Lock()
+
+# Track metadata is bound from datasources.nowPlaying, so the documents are
+# static per template file and autoplay value.
+_DATASOURCE_KEY = "nowPlaying"
+# The AudioPlayer layout instance; its parameters are bound values that every
+# component showing track metadata reads.
+_ROOT_COMPONENT_ID = "AudioPlayerRoot"
+# Painted under the cover art and background until the images arrive (see
+# artwork_cache.placeholder); always bound, so a new track without them
+# clears the previous track's.
+_PLACEHOLDER_FIELDS = ("placeholderColor", "coverPreviewSource")
+_NO_PLACEHOLDER = ("transparent", "")
+# Layout parameters refreshed while playing, placeholders first so they are
+# set before the new images start loading. audioSources is left alone:
+# changing it would restart the Video component.
+_REFRESHED_FIELDS = _PLACEHOLDER_FIELDS + ("primaryText", "secondaryText", "coverImageSource", "backgroundImageSource")
+# The queue overlay's list starts empty and unbounded above; the device
+# pages items in with LoadIndexListData (see queue_view).
+_QUEUE_DATASOURCE_KEY = "queue"
+QUEUE_LIST_ID = "queue"
+
+# Viewport classes and the alexa-layouts @viewportProfile each one is.
+# Every class gets a copy of the template with the @viewportProfile
+# conditions resolved; devices that fit none of them (portrait, mobile,
+# unusual sizes) get the full template.
+VIEWPORT_CLASSES = {
+    "round": "@hubRoundSmall",
+    "hub_small": "@hubLandscapeSmall",
+    "hub_medium": "@hubLandscapeMedium",
+    "hub_large": "@hubLandscapeLarge",
+    "hub_xlarge": "@hubLandscapeXLarge",
+    "tv": "@tvLandscapeXLarge",
+}
+# "${@viewportProfile == @x}" and "${@viewportProfile != @x ? 'a' : 'b'}";
+# choices that are resource references ('@...') are left to the device.
+_PROFILE_TEST = re.compile(r"^\$\{@viewportProfile\s*(==|!=)\s*(@\w+)\}$")
+_PROFILE_CHOICE = re.compile(r"^\$\{@viewportProfile\s*(==|!=)\s*(@\w+)\s*\?\s*'([^'@]*)'\s*:\s*'([^'@]*)'\s*\}$")
+
+# (mtime_ns, {(autoplay, viewport class): document}, {viewport class: bytes})
+# of the last parsed template. Documents are shared between renders and
+# must never be modified.
+_template = (None, {}, {})
+
+
+def _find_path(node, predicate, path=()):
+    """Return the key/index path to the first node matching predicate, or None."""
+    if isinstance(node, dict):
+        if predicate(node):
+            return path
+        children = node.items()
+    elif isinstance(node, list):
+        children = enumerate(node)
+    else:
+        return None
+    for key, child in children:
+        found = _find_path(child, predicate, path + (key,))
+        if found is not None:
+            return found
+    return None
+
+
+def _get_at(node, path):
+    for key in path:
+        node = node[key]
+    return node
+
+
+def _replace_at(node, path, value):
+    """Return a copy of node with the value at path replaced; untouched branches are shared."""
+    if not path:
+        return value
+    copy = list(node) if isinstance(node, list) else dict(node)
+    copy[path[0]] = _replace_at(node[path[0]], path[1:], value)
+    return copy
+
+
+def _set_autoplay(document, predicate, autoplay, what):
+    path = _find_path(document.get("layouts", {}), predicate)
+    if path is None:
+        logging.debug("Could not find %s in APL template", what)
+        return document
+    path = ("layouts",) + path
+    return _replace_at(document, path, dict(_get_at(document, path), autoplay=autoplay))
+
+
+def _strip_descriptions(node):
+    """Drop "description" keys; they document the template but the device ignores them."""
+    if isinstance(node, dict):
+        return {k: _strip_descriptions(v) for k, v in node.items() if k != "description"}
+    if isinstance(node, list):
+        return [_strip_descriptions(v) for v in node]
+    return node
+
+
+def viewport_class(viewport):
+    """Map an envelope's context.Viewport to a VIEWPORT_CLASSES key, or None.
+
+    Sizes are compared in dp (pixels * 160 / dpi), the unit the
+    alexa-layouts viewport profiles are defined in.
+    """
+    if viewport is None:
+        return None
+    try:
+        shape = getattr(viewport.shape, "value", viewport.shape)
+        mode = getattr(viewport.mode, "value", viewport.mode)
+        width = viewport.pixel_width * 160 / viewport.dpi
+        height = viewport.pixel_height * 160 / viewport.dpi
+    except (AttributeError, TypeError, ZeroDivisionError):
+        return None
+    if mode == "HUB" and shape == "ROUND":
+        return "round"
+    if shape != "RECTANGLE":
+        return None
+    if mode == "TV":
+        return "tv" if (width, height) == (960, 540) else None
+    if mode != "HUB":
+        return None
+    if 960 <= width < 1280:
+        if 480 <= height < 600:
+            return "hub_small"
+        if 600 <= height < 800:
+            return "hub_medium"
+    elif 1280 <= width < 1920 and 800 <= height < 1200:
+        return "hub_large"
+    elif width >= 1920 and height >= 1080:
+        return "hub_xlarge"
+    return None
+
+
+def _profile_matches(match, profile):
+    operator, other = match.group(1), match.group(2)
+    return (other == profile) == (operator == "==")
+
+
+def _profile_when(node):
+    when = node.get("when") if isinstance(node, dict) else None
+    return _PROFILE_TEST.match(when) if isinstance(when, str) else None
+
+
+def _specialise(node, profile):
+    """Return a copy of node with @viewportProfile conditions resolved for profile."""
+    if isinstance(node, list):
+        # Drop list items (components, resource blocks) whose condition is false.
+        return [_specialise(item, profile) for item in node
+                if not (_profile_when(item) and not _profile_matches(_profile_when(item), profile))]
+    if isinstance(node, dict):
+        when = _profile_when(node)
+        return {key: _specialise(value, profile) for key, value in node.items()
+                if not (key == "when" and when and _profile_matches(when, profile))}
+    if isinstance(node, str):
+        choice = _PROFILE_CHOICE.match(node)
+        if choice:
+            return choice.group(3) if _profile_matches(choice, profile) else choice.group(4)
+    return node
+
+
+def _parse_template():
+    """Parse the template and pre-build the autoplay/paused variant of each viewport class."""
+    with open(_TEMPLATE_PATH, 'r') as f:
+        master = _strip_descriptions(json.load(f))
+
+    variants = {}
+    sizes = {}
+    for vclass, profile in [(None, None)] + list(VIEWPORT_CLASSES.items()):
+        document = master if profile is None else _specialise(master, profile)
+        sizes[vclass or "default"] = len(json.dumps(document, separators=(',', ':')))
+        for autoplay in (True, False):
+            variant = _set_autoplay(document, lambda n: n.get("type") == "Video" and n.get("id") == "videoPlayer",
+                                    autoplay, "video player")
+            variant = _set_autoplay(variant, lambda n: (n.get("type") == "AlexaTransportControls" and
+                                                        n.get("mediaComponentId") == "videoPlayer"),
+                                    autoplay, "transport controls")
+            variants[(autoplay, vclass)] = variant
+    return variants, sizes
+
+
+def _current_template():
+    # type: () -> tuple
+    """Return (mtime_ns, {(autoplay, viewport class): document}, {class: bytes}), re-parsing if the file changed."""
+    global _template
+    mtime = os.stat(_TEMPLATE_PATH).st_mtime_ns
+    current = _template
+    if current[0] != mtime:
+        with _template_lock:
+            current = _template
+            if current[0] != mtime:
+                current = _template = (mtime,) + _parse_template()
+    return current
+
+
+def _queue_datasource():
+    return {
+        "type": "dynamicIndexList",
+        "listId": QUEUE_LIST_ID,
+        "startIndex": 0,
+        "minimumInclusiveIndex": 0,
+        "items": [],
+    }
+
+
+def _build_directive(metadata, autoplay, viewport_class=None):
+    # type: (dict, bool, str) -> RenderDocumentDirective
+    _mtime, variants, _sizes = _current_template()
+    # Parsed once; the autoplay value is already set in each variant and the
+    # metadata (image URLs already public) is bound from the datasource.
+    document = variants.get((autoplay, viewport_class)) or variants[(autoplay, None)]
+    return RenderDocumentDirective(
+        token="playbackToken",
+        document=document,
+        datasources={_DATASOURCE_KEY: dict(metadata), _QUEUE_DATASOURCE_KEY: _queue_datasource()}
+    )
+
+
+# Values last sent to each device's rendered document: device id ->
+# {(component id, property): value}. Bounded; an evicted device is sent
+# every value again on its next refresh.
+_displayed = OrderedDict()
+_DISPLAYED_MAX = 256
+_displayed_lock = threading.Lock()
+_displayed_stats = {'sent': 0, 'skipped': 0}
 
-def add_apl(response_builder, start_paused=False):
-    # type: (ResponseFactory, bool) -> None
-    """Add the RenderDocumentDirective to the response with APL document."""
-    # Import here to avoid circular imports
-    from .util import get_ma_hostname, replace_ip_in_url
 
+def _remember_displayed(device_id, shown):
+    _displayed.pop(device_id, None)
+    _displayed[device_id] = shown
+    while len(_displayed) > _DISPLAYED_MAX:
+        _displayed.popitem(last=False)
+
+
+def _with_placeholders(metadata):
+    """Return metadata with the placeholder colour and preview of its cover, if known yet."""
+    found = artwork_cache.placeholder(metadata.get("coverImageSource")) or _NO_PLACEHOLDER
+    return dict(metadata, **dict(zip(_PLACEHOLDER_FIELDS, found)))
+
+
+def _bound_values(metadata):
+    return {(_ROOT_COMPONENT_ID, name): metadata[name] for name in _REFRESHED_FIELDS
+            if metadata.get(name) or (name in _PLACEHOLDER_FIELDS and name in metadata)}
+
+
+def note_rendered(device_id, directive):
+    # type: (str, RenderDocumentDirective) -> None
+    """Record the values a RenderDocument sent to device_id displays, replacing earlier ones."""
+    if device_id is None:
+        return
+    metadata = (directive.datasources or {}).get(_DATASOURCE_KEY) or {}
+    with _displayed_lock:
+        _remember_displayed(device_id, _bound_values(metadata))
+
+
+def metadata_commands(metadata, device_id=None):
+    # type: (dict, str) -> list
+    """SetValue commands that show `metadata` in an already rendered document.
+
+    With a device_id, only values that differ from those last sent to that
+    device are included (possibly none).
+    """
+    wanted = _bound_values(_with_placeholders(metadata))
+    if device_id is not None:
+        with _displayed_lock:
+            shown = _displayed.get(device_id) or {}
+            changed = {key: value for key, value in wanted.items() if shown.get(key) != value}
+            _remember_displayed(device_id, {**shown, **changed})
+            _displayed_stats['sent'] += len(changed)
+            _displayed_stats['skipped'] += len(wanted) - len(changed)
+        wanted = changed
+    return [
+        {
+            "type": "SetValue",
+            "componentId": component,
+            "property": name,
+            "value": value
+        }
+        for (component, name), value in wanted.items()
+    ]
+
+
+def placeholders_pending(metadata, device_id):
+    # type: (dict, str) -> bool
+    """True if device_id does not show the placeholder values metadata's cover has by now.
+
+    Placeholders are derived in the background after a cover is first
+    shown, so they can become known without a new record version.
+    """
+    if device_id is None:
+        return False
+    found = artwork_cache.placeholder(metadata.get("coverImageSource")) or _NO_PLACEHOLDER
+    with _displayed_lock:
+        shown = _displayed.get(device_id) or {}
+        return any(shown.get((_ROOT_COMPONENT_ID, name)) != value
+                   for name, value in zip(_PLACEHOLDER_FIELDS, found))
+
+
+def set_value_stats():
+    with _displayed_lock:
+        return dict(_displayed_stats, devices=len(_displayed))
+
+
+# Serialized RenderDocument directives keyed by (template mtime, record
+# version, autoplay, viewport class, placeholders known); values are
+# (player_id, JSON text).
+# Only used once enable_directive_splicing() has been called, i.e. when
+# responses are serialized by to_json() (app.py), not by the Lambda handler.
+_directive_cache = OrderedDict()
+_DIRECTIVE_CACHE_MAX = 32
+_directive_lock = threading.Lock()
+_directive_stats = {'hits': 0, 'misses': 0, 'invalidated': 0}
+_splicing = False
+_serializer = DefaultSerializer()
+# Placeholder directive token / JSON marker; random so that pushed
+# metadata can never contain it.
+_SPLICE_TOKEN = f"__cached_apl_{uuid.uuid4().hex}__"
+
+
+def enable_directive_splicing():
+    """Let add_apl() emit cached directive JSON; responses must then be serialized with to_json()."""
+    global _splicing
+    _splicing = True
+
+
+def _on_now_playing(snapshot):
+    with _directive_lock:
+        stale = [key for key, (player, _text) in _directive_cache.items() if player == snapshot.player_id]
+        for key in stale:
+            del _directive_cache[key]
+        _directive_stats['invalidated'] += len(stale)
+
+
+event_bus.subscribe(event_bus.NOW_PLAYING, _on_now_playing)
+
+
+def _cached_directive_json(key, player, metadata, autoplay, viewport_class):
+    with _directive_lock:
+        entry = _directive_cache.get(key)
+        if entry is not None:
+            _directive_cache.move_to_end(key)
+            _directive_stats['hits'] += 1
+            return entry[1]
+    text = json.dumps(_serializer.serialize(_build_directive(metadata, autoplay, viewport_class)), separators=(',', ':'))
+    with _directive_lock:
+        _directive_stats['misses'] += 1
+        _directive_cache[key] = (player, text)
+        while len(_directive_cache) > _DIRECTIVE_CACHE_MAX:
+            _directive_cache.popitem(last=False)
+    return text
+
+
+def add_apl(response_builder, start_paused=False, player_id=None, viewport_class=None):
+    # type: (ResponseFactory, bool, str, str) -> None
+    """Add the RenderDocumentDirective to the response with APL document."""
     # Get metadata from shared_store (most reliable) or data.info as fallback
-    metadata = _get_metadata()
+    metadata, snapshot = _get_metadata(player_id)
     if not metadata:
         logging.warning("No metadata available for APL rendering")
         return
 
-    # Replace MA-hosted image sources if MA_HOSTNAME is set
-    try:
-        hostname = get_ma_hostname(raise_on_http_scheme=False)
-    except ValueError:
-        hostname = ''
+    metadata = _with_placeholders(metadata)
+    autoplay = not start_paused
+    if not _splicing or snapshot is None:
+        response_builder.add_directive(_build_directive(metadata, autoplay, viewport_class))
+        return
 
-    cover_image = metadata.get("coverImageSource", "")
-    background_image = metadata.get("backgroundImageSource", "")
+    key = (_current_template()[0], snapshot.version, autoplay, viewport_class, bool(metadata["coverPreviewSource"]))
+    text = _cached_directive_json(key, snapshot.player_id, metadata, autoplay, viewport_class)
+    # to_json() swaps this placeholder for the cached JSON text; the
+    # datasources are only read by note_rendered().
+    response_builder.add_directive(RenderDocumentDirective(
+        token=_SPLICE_TOKEN, document={_SPLICE_TOKEN: text}, datasources={_DATASOURCE_KEY: dict(metadata)}))
 
-    if hostname:
-        cover_image = replace_ip_in_url(cover_image, hostname)
-        background_image = replace_ip_in_url(background_image, hostname)
 
-    # Load the APL document template
-    apl_document = _load_apl_template()
+def to_json(response):
+    # type: (dict) -> str
+    """Serialize a skill response dict, splicing in cached directive JSON."""
+    spliced = []
+    directives = (response.get("response") or {}).get("directives") or []
+    for i, directive in enumerate(directives):
+        if isinstance(directive, dict) and directive.get("token") == _SPLICE_TOKEN:
+            marker = f"{_SPLICE_TOKEN}{len(spliced)}"
+            spliced.append((json.dumps(marker), directive["document"][_SPLICE_TOKEN]))
+            directives[i] = marker
+    text = json.dumps(response, separators=(',', ':'))
+    for marker, directive_json in spliced:
+        text = text.replace(marker, directive_json, 1)
+    return text
 
-    # Set the dynamic autoplay value based on start_paused
-    autoplay = not start_paused
 
-    # Update autoplay in Video component and AlexaTransportControls
-    try:
-        video_component = apl_document["layouts"]["AudioPlayer"]["item"][0]["items"][2]["items"][1]["items"][0]
-        video_component["autoplay"] = autoplay
-    except (KeyError, IndexError):
-        logging.debug("Could not set video autoplay in APL template")
+def directive_cache_stats():
+    with _directive_lock:
+        return dict(_directive_stats, entries=len(_directive_cache))
 
-    try:
-        transport_controls = apl_document["layouts"]["AudioPlayer"]["item"][0]["items"][2]["items"][1]["items"][1]["items"][0]["item"][1]
-        transport_controls["autoplay"] = autoplay
-    except (KeyError, IndexError):
-        logging.debug("Could not set transport autoplay in APL template")
 
-    # Update mainTemplate with metadata values
-    try:
-        main_template_item = apl_document["mainTemplate"]["items"][0]
-        main_template_item.update({
-            "audioSources": metadata.get("audioSources", ""),
-            "backgroundImageSource": background_image,
-            "coverImageSource": cover_image,
-            "headerAttributionImage": metadata.get("headerAttributionImage", ""),
-            "headerTitle": metadata.get("headerTitle", ""),
-            "headerSubtitle": metadata.get("headerSubtitle", ""),
-            "primaryText": metadata.get("primaryText", ""),
-            "secondaryText": metadata.get("secondaryText", "")
-        })
-    except (KeyError, IndexError):
-        logging.warning("Could not update mainTemplate in APL document")
-
-    response_builder.add_directive(
-        RenderDocumentDirective(
-            token="playbackToken",
-            document=apl_document,
-            datasources={}
-        )
-    )
+def document_sizes():
+    """Serialized size in bytes of the document sent to each viewport class."""
+    return dict(_current_template()[2])
 
 
-def _get_metadata():
-    """Get metadata from shared_store or data.info.
+def _get_metadata(player_id=None):
+    """Get (APL field map, NowPlaying snapshot) for player_id.
 
-    shared_store is the primary source (set by MA push-url).
-    data.info is the fallback (set by data.get_latest()).
+    shared_store is the primary source (set by MA push-url); the field map
+    is derived once when the record is pushed.
+    data.info is the fallback (set by data.get_latest()); it has no snapshot.
     """
     # Priority 1: shared_store (most reliable, set by MA)
     try:
-        import shared_store
-        if shared_store._store:
-            store = shared_store._store
-            return {
-                "audioSources": store.get("streamUrl", ""),
-                "backgroundImageSource": store.get("imageUrl", ""),
-                "coverImageSource": store.get("imageUrl", ""),
-                "headerAttributionImage": "",
-                "headerTitle": "",
-                "headerSubtitle": "",
-                "primaryText": store.get("title", ""),
-                "secondaryText": _build_secondary_text(store)
-            }
+        store = shared_store.get_latest(player_id)
+        if store:
+            return store.apl_fields, store
     except Exception as e:
         logging.debug("shared_store read failed in APL: %s", e)
 
     # Priority 2: data.info (fallback)
     try:
         if data.info and data.info.get("audioSources"):
-            return data.info
+            return data.info, None
     except Exception:
         pass
 
-    return None
+    return None, None
 
 
-def _build_secondary_text(store):
-    """Build secondary text from artist and album."""
-    artist = store.get("artist", "")
-    album = store.get("album", "")
-    if artist and album:
-        return f"{artist} - {album}"
-    elif artist:
-        return artist
-    elif album:
-        return album
-    return ""
+# Build the viewport variants at startup rather than on the first render.
+try:
+    _current_template()
+except (OSError, ValueError):
+    logging.exception("Could not load APL template")
@@ -6,18 +6,25 @@ import json
 import os
 import sys
 import logging
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
 from typing import Optional
 from env_secrets import get_env_secret
+import latency
+import singleflight
+import urllib.parse
 import urllib.request
 import urllib.error
 import base64
-import re
 
 # Fuege /app/src/ zum Python-Pfad hinzu
 _app_src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if _app_src not in sys.path:
     sys.path.insert(0, _app_src)
 
+import shared_store
+
 WELCOME_MSG = _("")
 HELP_MSG = _("Welcome to {}. You can play, stop, resume listening.  How can I help you ?")
 UNHANDLED_MSG = _("Sorry, I could not understand what you've just said.")
@@ -29,7 +36,9 @@ DEVICE_NOT_SUPPORTED = _("Sorry, this skill is not supported on this device")
 DEVICE_NOT_MAPPED_MSG = _("This device is not paired with a Music Assistant player yet. Please configure it on the status page.")
 MA_COMMAND_FAILED_MSG = _("Sorry, I could not reach Music Assistant to skip the track.")
 
-info = {
+# Read-only view of the last loaded player info (for the status page).
+# Rebound to a new mapping on every load, never updated in place.
+info = MappingProxyType({
     "audioSources": "",
     "backgroundImageSource": "",
     "coverImageSource": "",
@@ -38,113 +47,105 @@ info = {
     "headerSubtitle": "",
     "primaryText": "",
     "secondaryText": ""
-}
+})
 
-def get_latest(api_hostname=None, path='/ma/latest-url', scheme='http', timeout=5, username=None, password=None):
-    global info
+# get_latest() result when nothing has been pushed yet (and no remote
+# source is configured, or it has nothing either).
+NO_DATA = {'changed': False, 'available': False}
 
-    # PRIORITAET 1: Direkt aus shared_store lesen (KEIN CACHE!)
-    try:
-        import shared_store
-        if shared_store._store and shared_store._store.get('streamUrl'):
-            payload = shared_store._store
-
-            stream_url = payload.get('streamUrl') or ''
-            title = payload.get('title', '') or ''
-            artist = payload.get('artist', '') or ''
-            album = payload.get('album', '') or ''
-            image = payload.get('imageUrl') or ''
-
-            secondary = ''
-            if artist and album:
-                secondary = f"{artist} - {album}"
-            elif artist:
-                secondary = artist
-            elif album:
-                secondary = album
-
-            if stream_url and isinstance(stream_url, str):
-                try:
-                    stream_url = re.sub(r'(?i)\.flac(?=$|\?)', '.mp3', stream_url)
-                except Exception:
-                    logging.exception('Failed rewriting stream URL extension for %s', stream_url)
-
-            info.update({
-                'audioSources': stream_url,
-                'backgroundImageSource': image,
-                'coverImageSource': image,
-                'headerAttributionImage': '',
-                'headerTitle': '',
-                'headerSubtitle': '',
-                'primaryText': title,
-                'secondaryText': secondary
-            })
-
-            logging.info('Loaded from shared_store: %s - %s', title, stream_url[:60])
-            return {'changed': True}
-    except Exception as e:
-        logging.warning('shared_store read failed: %s', e)
-
-    # FALLBACK: Original HTTP behavior
-    port = os.environ.get('PORT')
-    api_hostname = f'127.0.0.1:{port}'
-    url = f"{scheme}://{api_hostname.rstrip('/')}{path if path.startswith('/') else '/' + path}"
+
+def _fetch_latest_payload(url, headers, timeout):
+    """GET the latest-url JSON; return the payload dict or None."""
+    req = urllib.request.Request(url, headers=headers)
+    with latency.measure('metadata', url), urllib.request.urlopen(req, timeout=timeout) as resp:
+        code = getattr(resp, 'status', None) or getattr(resp, 'getcode', lambda: None)()
+        if code and int(code) != 200:
+            return None
+        payload = json.loads(resp.read().decode('utf-8'))
+        return payload if isinstance(payload, dict) else None
+
+
+def _fetch_remote_latest(url, timeout=None):
+    """Fetch the latest record from a separately running API process.
+
+    Only used when METADATA_REMOTE_URL is configured, i.e. when the skill
+    does not share a process (and so shared_store) with the /ma API.
+    """
     headers = {}
-    env_user = get_env_secret('APP_USERNAME')
-    env_pass = get_env_secret('APP_PASSWORD')
-    if not username and env_user:
-        username = env_user
-    if not password and env_pass:
-        password = env_pass
-    auth_value = None
+    username = get_env_secret('APP_USERNAME')
+    password = get_env_secret('APP_PASSWORD')
     if username and password:
         b64 = base64.b64encode(f"{username}:{password}".encode('utf-8')).decode('ascii')
-        auth_value = f"Basic {b64}"
-    if auth_value:
-        headers['Authorization'] = auth_value
-
+        headers['Authorization'] = f"Basic {b64}"
+    if timeout is None:
+        timeout = latency.timeout_for('metadata', url)
     try:
-        req = urllib.request.Request(url, headers=headers)
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            code = getattr(resp, 'status', None) or getattr(resp, 'getcode', lambda: None)()
-            if code and int(code) != 200:
-                return {'changed': False}
-            payload = json.loads(resp.read().decode('utf-8'))
-            if not isinstance(payload, dict):
-                return {'changed': False}
-
-            stream_url = payload.get('streamUrl') or ''
-            title = payload.get('title', '') or ''
-            artist = payload.get('artist', '') or ''
-            album = payload.get('album', '') or ''
-            image = payload.get('imageUrl') or ''
-
-            secondary = ''
-            if artist and album:
-                secondary = f"{artist} - {album}"
-            elif artist:
-                secondary = artist
-            elif album:
-                secondary = album
-
-            if stream_url and isinstance(stream_url, str):
-                try:
-                    stream_url = re.sub(r'(?i)\.flac(?=$|\?)', '.mp3', stream_url)
-                except Exception:
-                    pass
-
-            info.update({
-                'audioSources': stream_url,
-                'backgroundImageSource': image,
-                'coverImageSource': image,
-                'headerAttributionImage': '',
-                'headerTitle': '',
-                'headerSubtitle': '',
-                'primaryText': title,
-                'secondaryText': secondary
-            })
-
-            return {'changed': True}
-    except Exception:
-        pass
-    return {'changed': False}
+        # Concurrent launches from grouped devices share one fetch.
+        return singleflight.do(('metadata_fetch', url), _fetch_latest_payload, url, headers, timeout)
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        logging.warning('Remote metadata fetch from %s failed: %s', url, e)
+        return None
+
+
+# Store version last reported to each caller (an Echo device id). Bounded:
+# old devices fall out and are simply told "changed" once more if they
+# come back.
+_seen_versions = OrderedDict()
+_SEEN_VERSIONS_MAX = 256
+_versions_lock = threading.Lock()
+
+
+def _mark_seen(caller, version):
+    """Record that `caller` has seen `version`; return True if it is new to them."""
+    if caller is None or version is None:
+        return True
+    with _versions_lock:
+        previous = _seen_versions.pop(caller, None)
+        _seen_versions[caller] = version
+        while len(_seen_versions) > _SEEN_VERSIONS_MAX:
+            _seen_versions.popitem(last=False)
+    return previous != version
+
+
+def seen_version(caller):
+    """Return the store version last reported to `caller` by get_latest(), or None."""
+    with _versions_lock:
+        version = _seen_versions.get(caller)
+        if version is not None:
+            _seen_versions.move_to_end(caller)
+        return version
+
+
+def get_latest(timeout=None, caller=None, player_id=None):
+    """Load the latest pushed metadata for player_id (see shared_store.get_latest).
+
+    Reads the in-process shared_store. Only if that is empty and
+    METADATA_REMOTE_URL is set does it fall back to fetching a remote
+    /ma/latest-url. Returns NO_DATA when there is nothing to show;
+    otherwise the result carries the NowPlaying snapshot ('now_playing') and
+    its read-only 'info' mapping (derived once when the record was pushed), which is also
+    published as the module-level `info` (last loaded, for the status page).
+
+    'changed' is True only if the record version differs from the one last
+    reported to `caller` (e.g. the requesting device id); without a caller
+    every call counts as changed.
+    """
+    global info
+
+    now_playing = shared_store.get_latest(player_id)
+    if now_playing is None:
+        remote_url = os.environ.get('METADATA_REMOTE_URL', '').strip()
+        if not remote_url:
+            return NO_DATA
+        if player_id:
+            remote_url += ('&' if '?' in remote_url else '?') + urllib.parse.urlencode({'playerId': player_id})
+        payload = _fetch_remote_latest(remote_url, timeout=timeout)
+        if not payload or not payload.get('streamUrl'):
+            return NO_DATA
+        now_playing = shared_store.NowPlaying.from_dict(payload)
+
+    version = now_playing.version
+    player_info = now_playing.info
+    info = player_info
+    return {'changed': _mark_seen(caller, version), 'available': True,
+            'version': version, 'info': player_info, 'now_playing': now_playing}
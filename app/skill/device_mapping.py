@@ -18,24 +18,46 @@ logger = logging.getLogger(__name__)
 _DEFAULT_PATH = "/app/instance_data/device_players.json"
 _lock = threading.Lock()
 
+# (path, mtime_ns, mapping) of the last successful read. Skill handlers look
+# up the player on every request (including per-second APL refreshes), so
+# only re-read the file when it changes.
+_cache = (None, None, {})
+
 
 def _path():
     return os.environ.get("DEVICE_MAPPING_PATH", _DEFAULT_PATH)
 
 
-def load_mapping():
-    """Return the device_id -> player_id mapping dict (empty if none saved yet)."""
+def _read_cached():
+    global _cache
     path = _path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    except OSError:
+        logger.exception("Failed to stat device mapping %s", path)
+        return {}
+    cached_path, cached_mtime, cached = _cache
+    if cached_path == path and cached_mtime == mtime:
+        return cached
     try:
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
-            if isinstance(data, dict):
-                return data
     except FileNotFoundError:
         return {}
     except Exception:
         logger.exception("Failed to read device mapping from %s", path)
-    return {}
+        return {}
+    if not isinstance(data, dict):
+        data = {}
+    _cache = (path, mtime, data)
+    return data
+
+
+def load_mapping():
+    """Return the device_id -> player_id mapping dict (empty if none saved yet)."""
+    return dict(_read_cached())
 
 
 def save_mapping(mapping):
@@ -56,7 +78,7 @@ def save_mapping(mapping):
 def get_player_for_device(device_id):
     if not device_id:
         return None
-    return load_mapping().get(device_id)
+    return _read_cached().get(device_id)
 
 
 def set_player_for_device(device_id, player_id):
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Fast path for APL MetadataRefresh UserEvents that bring nothing new.
+
+Every Echo Show showing the player sends one of these per refresh
+interval, and almost all of them find the record unchanged. For those,
+the full skill dispatch (envelope deserialization, interceptors, handler
+lookup, response model serialization) only produces "schedule the next
+refresh". app.py checks unchanged() on the already parsed body, runs the
+usual request verifiers, and then returns respond(): the same response
+APLUserEventHandler would build, filled into a pre-serialized template.
+Anything else (other requests, a changed or missing record, placeholders
+found since the device last got its cover, APL disabled) goes through
+the full dispatch.
+"""
+
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+
+from ask_sdk_core.response_helper import ResponseFactory
+from ask_sdk_core.serialize import DefaultSerializer
+from ask_sdk_runtime.utils import UserAgentManager
+
+from . import apl, data, device_mapping, refresh_schedule, util
+
+_app_src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _app_src not in sys.path:
+    sys.path.insert(0, _app_src)
+
+import shared_store
+
+_USER_EVENT = "Alexa.Presentation.APL.UserEvent"
+# Placeholder delay, replaced everywhere in the serialized schedule directive.
+_DELAY_MARK = 987654321
+
+_template = None
+_template_lock = threading.Lock()
+_lock = threading.Lock()
+_stats = {'fast': 0, 'full': 0}
+
+
+def enabled():
+    return os.environ.get('APL_FAST_REFRESH', 'true').lower() in ('true', '1', 'yes')
+
+
+def _device_id(payload):
+    try:
+        return payload["context"]["System"]["device"]["deviceId"]
+    except (KeyError, TypeError):
+        return None
+
+
+def is_refresh(payload):
+    """True if the parsed request body is an APL MetadataRefresh UserEvent."""
+    try:
+        request = payload["request"]
+        arguments = request.get("arguments")
+        return (request.get("type") == _USER_EVENT and isinstance(arguments, list)
+                and bool(arguments) and arguments[0] == "MetadataRefresh")
+    except (KeyError, TypeError, AttributeError):
+        return False
+
+
+def _current(payload):
+    """The record a refresh from this device would see, if the device already shows all of it."""
+    device_id = _device_id(payload)
+    if not device_id:
+        return None
+    current = shared_store.get_latest(device_mapping.get_player_for_device(device_id))
+    if current is None or data.seen_version(device_id) != current.version:
+        return None
+    if apl.placeholders_pending(current.info, device_id):
+        return None
+    return current
+
+
+def unchanged(payload):
+    """True if payload is a MetadataRefresh this module can answer."""
+    if not (enabled() and util.apl_enabled() and is_refresh(payload)):
+        return False
+    if _current(payload) is None:
+        with _lock:
+            _stats['full'] += 1
+        return False
+    return True
+
+
+def verification_view(payload):
+    """The parts of a RequestEnvelope the webservice request verifiers read, or None.
+
+    The signature verifier only checks the raw body against the headers;
+    the timestamp verifier reads request.timestamp and request.object_type.
+    """
+    try:
+        timestamp = datetime.fromisoformat(payload["request"]["timestamp"].replace("Z", "+00:00"))
+    except (KeyError, TypeError, AttributeError, ValueError):
+        return None
+    return SimpleNamespace(request=SimpleNamespace(object_type=_USER_EVENT, timestamp=timestamp))
+
+
+def _response_template():
+    """Return the serialized refresh response split at the session attributes and at each delay."""
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                factory = ResponseFactory()
+                util.schedule_apl_refresh(factory, delay_ms=_DELAY_MARK)
+                factory.set_should_end_session(False)
+                response = json.dumps(DefaultSerializer().serialize(factory.response), separators=(',', ':'))
+                parts = response.split(str(_DELAY_MARK))
+                parts[0] = f'"userAgent":{json.dumps(UserAgentManager.get_user_agent())},"response":{parts[0]}'
+                parts[-1] += '}'
+                _template = tuple(parts)
+    return _template
+
+
+def respond(payload):
+    """Return the response text for an unchanged refresh, or None if the full dispatch must handle it."""
+    current = _current(payload)
+    if current is None:
+        return None
+    device_id = _device_id(payload)
+    delay_ms = refresh_schedule.next_delay_ms(device_id, False, current)
+    parts = _response_template()
+    session = payload.get("session")
+    attributes = ''
+    if session is not None:
+        attributes = f'"sessionAttributes":{json.dumps(session.get("attributes") or {}, separators=(",", ":"))},'
+    with _lock:
+        _stats['fast'] += 1
+    return f'{{"version":"1.0",{attributes}{str(delay_ms).join(parts)}'
+
+
+def stats():
+    with _lock:
+        return dict(_stats)
@@ -3,6 +3,9 @@
 import logging
 import gettext
 import os
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from ask_sdk.standard import StandardSkillBuilder
 from ask_sdk_core.dispatch_components import (
     AbstractRequestHandler, AbstractExceptionHandler,
@@ -11,7 +14,10 @@ from ask_sdk_core.utils import is_request_type, is_intent_name
 from ask_sdk_core.handler_input import HandlerInput
 from ask_sdk_model import Response
 
-from . import data, util, device_mapping, ma_control
+from ask_sdk_model.interfaces.alexa.presentation.apl import RenderDocumentDirective, SendIndexListDataDirective
+
+from . import apl, data, util, device_mapping, ma_control, queue_view, refresh_schedule
+from env import float_env
 
 sb = StandardSkillBuilder()
 # sb = StandardSkillBuilder(
@@ -90,18 +96,19 @@ logging.basicConfig(
 
 supports_apl = False
 
-def _get_stream_url(request):
+def _get_stream_url(request, player_id=None):
     """Return (url, audio_data) where url is resolved from util.audio_data.
 
-    Handles multiple shapes returned by util.audio_data and never raises.
+    Uses player_id's record when given. Handles multiple shapes returned
+    by util.audio_data and never raises.
     """
     try:
-        audio = util.audio_data(request)
+        audio = util.audio_data(request, player_id)
     except Exception:
         audio = None
 
     url = None
-    if isinstance(audio, dict):
+    if isinstance(audio, Mapping):
         url = (audio.get('url') or audio.get('audioSources') or
                audio.get('audio_sources') or audio.get('stream') or '')
     elif isinstance(audio, str):
@@ -173,15 +180,17 @@ class LaunchRequestOrPlayAudioHandler(AbstractRequestHandler):
 
         _ = handler_input.attributes_manager.request_attributes["_"]
         request = handler_input.request_envelope.request
-        url, _audio = _get_stream_url(request)
+        player_id = _player_id_from(handler_input)
+        url, _audio = _get_stream_url(request, player_id)
         logger.info("URL from util.audio_data: %s", url)
 
         # FIX: Fallback to shared_store directly if util.audio_data is empty
         if not url:
             try:
                 import shared_store
-                if shared_store._store and shared_store._store.get('streamUrl'):
-                    url = shared_store._store['streamUrl']
+                latest = shared_store.get_latest(player_id)
+                if latest:
+                    url = latest.play_url
                     logger.info("URL from shared_store fallback: %s", url)
             except Exception as e:
                 logger.warning("shared_store fallback failed: %s", e)
@@ -198,7 +207,9 @@ class LaunchRequestOrPlayAudioHandler(AbstractRequestHandler):
             offset=0,
             text=data.WELCOME_MSG,
             response_builder=handler_input.response_builder,
-            supports_apl=supports_apl
+            supports_apl=supports_apl,
+            player_id=player_id,
+            viewport_class=_viewport_class_from(handler_input)
         )
 
 
@@ -249,6 +260,31 @@ def _device_id_from(handler_input):
         return None
 
 
+def _viewport_class_from(handler_input):
+    """APL viewport class of the requesting screen (None for unknown or no screen)."""
+    try:
+        return apl.viewport_class(handler_input.request_envelope.context.viewport)
+    except Exception:
+        return None
+
+
+def _player_id_from(handler_input):
+    """MA player paired with the requesting device via /devices, if any."""
+    return device_mapping.get_player_for_device(_device_id_from(handler_input))
+
+
+# Shared pool for work that can overlap with building the Alexa response
+# (currently the MA pause/stop/resume sync). Kept small: these are
+# voice-triggered, so there are rarely more than a few in flight.
+_background = ThreadPoolExecutor(max_workers=4, thread_name_prefix="skill-bg")
+
+# How long a handler waits for a concurrent MA sync before answering Alexa
+# without it. Alexa gives up on the skill after 8s, so stay well below that;
+# a sync that overruns keeps going in the background.
+def _ma_sync_deadline():
+    return float_env('MA_SYNC_DEADLINE_SECONDS', 5)
+
+
 def _sync_to_ma_unless_echo(handler_input, command):
     """Best-effort: forward pause/stop/resume to MA, unless this request is
     the echo of a command we ourselves just triggered on MA (see ma_control
@@ -272,6 +308,37 @@ def _sync_to_ma_unless_echo(handler_input, command):
         logger.warning("Failed to sync %s to MA player %s", command, player_id)
 
 
+def _start_ma_sync(handler_input, command):
+    """Run _sync_to_ma_unless_echo on the shared executor.
+
+    Returns a (future, started_at) pair for _join_ma_sync, so the caller can
+    resolve/validate the stream while the MA round trip is in flight.
+    """
+    started_at = time.monotonic()
+    try:
+        return _background.submit(_sync_to_ma_unless_echo, handler_input, command), started_at
+    except RuntimeError:
+        # Executor already shut down (interpreter exiting) - sync inline.
+        _sync_to_ma_unless_echo(handler_input, command)
+        return None, started_at
+
+
+def _join_ma_sync(pending, command):
+    """Wait for a sync started by _start_ma_sync, at most until its deadline."""
+    future, started_at = pending
+    if future is None:
+        return
+    deadline = _ma_sync_deadline()
+    remaining = deadline - (time.monotonic() - started_at)
+    try:
+        future.result(timeout=max(remaining, 0))
+    except FutureTimeoutError:
+        logger.warning("MA %s sync still running after %.1fs; responding without waiting for it",
+                       command, deadline)
+    except Exception:
+        logger.exception("MA %s sync failed", command)
+
+
 class NextOrPreviousIntentHandler(AbstractRequestHandler):
     """Handler for next or previous intents.
 
@@ -320,8 +387,10 @@ class CancelOrStopIntentHandler(AbstractRequestHandler):
         # type: (HandlerInput) -> Response
         logger.info("In CancelOrStopIntentHandler")
         _ = handler_input.attributes_manager.request_attributes["_"]
-        _sync_to_ma_unless_echo(handler_input, "stop")
-        return util.stop(_(data.STOP_MSG), handler_input.response_builder, supports_apl=supports_apl)
+        pending = _start_ma_sync(handler_input, "stop")
+        response = util.stop(_(data.STOP_MSG), handler_input.response_builder, supports_apl=supports_apl)
+        _join_ma_sync(pending, "stop")
+        return response
 
 
 class PauseIntentHandler(AbstractRequestHandler):
@@ -338,12 +407,16 @@ class PauseIntentHandler(AbstractRequestHandler):
         if getattr(handler_input.request_envelope, 'session', None):
             session_new = bool(handler_input.request_envelope.session.new)
 
-        _sync_to_ma_unless_echo(handler_input, "pause")
+        pending = _start_ma_sync(handler_input, "pause")
 
-        return util.pause(text=None,
+        response = util.pause(text=None,
                   response_builder=handler_input.response_builder,
                   supports_apl=supports_apl,
-                  session_new=session_new)
+                  session_new=session_new,
+                  player_id=_player_id_from(handler_input),
+                  viewport_class=_viewport_class_from(handler_input))
+        _join_ma_sync(pending, "pause")
+        return response
 
 
 class ResumeIntentHandler(AbstractRequestHandler):
@@ -358,24 +431,32 @@ class ResumeIntentHandler(AbstractRequestHandler):
         request = handler_input.request_envelope.request
         _ = handler_input.attributes_manager.request_attributes["_"]
 
-        _sync_to_ma_unless_echo(handler_input, "resume")
+        # The MA sync and the stream resolution/validation below are
+        # independent, so overlap them instead of paying for both in turn.
+        pending = _start_ma_sync(handler_input, "resume")
 
-        url, _audio = _get_stream_url(request)
+        player_id = _player_id_from(handler_input)
+        url, _audio = _get_stream_url(request, player_id)
         if not url:
             logger.warning("No stream url available for Resume request")
             handler_input.response_builder.speak(
                 "Sorry, I couldn't reach the stream right now.").set_should_end_session(True)
+            _join_ma_sync(pending, "resume")
             return handler_input.response_builder.response
 
         offset = util.get_resume_offset(_device_id_from(handler_input), url)
 
-        return util.play(
+        response = util.play(
             url=url,
             offset=offset,
             text=data.WELCOME_MSG,
             response_builder=handler_input.response_builder,
-            supports_apl=supports_apl
+            supports_apl=supports_apl,
+            player_id=player_id,
+            viewport_class=_viewport_class_from(handler_input)
         )
+        _join_ma_sync(pending, "resume")
+        return response
 
 
 class StartOverIntentHandler(AbstractRequestHandler):
@@ -504,7 +585,7 @@ class PlaybackNearlyFinishedHandler(AbstractRequestHandler):
         logger.info("In PlaybackNearlyFinishedHandler")
         logger.info("Playback nearly finished")
         request = handler_input.request_envelope.request
-        url, _audio = _get_stream_url(request)
+        url, _audio = _get_stream_url(request, _player_id_from(handler_input))
         if not url:
             logger.warning("No stream url available for PlaybackNearlyFinished")
             return handler_input.response_builder.response
@@ -529,7 +610,8 @@ class PlaybackFailedHandler(AbstractRequestHandler):
         logger.info("In PlaybackFailedHandler")
         request = handler_input.request_envelope.request
         logger.info("Playback failed: {}".format(request.error))
-        url, _audio = _get_stream_url(request)
+        player_id = _player_id_from(handler_input)
+        url, _audio = _get_stream_url(request, player_id)
         if not url:
             logger.warning("No stream url available for PlaybackFailed; skipping restart")
             return handler_input.response_builder.response
@@ -539,7 +621,9 @@ class PlaybackFailedHandler(AbstractRequestHandler):
             offset=0, 
             text=None,
             response_builder=handler_input.response_builder,
-            supports_apl=supports_apl
+            supports_apl=supports_apl,
+            player_id=player_id,
+            viewport_class=_viewport_class_from(handler_input)
         )
 
 
@@ -591,8 +675,12 @@ class APLUserEventHandler(AbstractRequestHandler):
 
         # Fetch latest metadata from Music Assistant
         changed = False
+        result = data.NO_DATA
         try:
-            result = data.get_latest()
+            # Only a real version bump since this device's last refresh
+            # counts; otherwise no SetValue commands are sent.
+            result = data.get_latest(caller=_device_id_from(handler_input),
+                                     player_id=_player_id_from(handler_input))
             changed = bool(result and result.get('changed'))
             if changed:
                 logger.info("Metadata changed")
@@ -602,26 +690,61 @@ class APLUserEventHandler(AbstractRequestHandler):
             logger.exception("Failed to fetch latest metadata")
 
         # Check if we have valid metadata
-        if not data.info.get('audioSources'):
-            logger.warning("No audio sources available for metadata refresh")
+        metadata = result.get('info') or {}
+        if not metadata.get('audioSources'):
+            # Expected until MA's first push.
+            logger.debug("No audio sources available for metadata refresh")
         else:
-            # Send updated APL document with new metadata
-            if changed:
+            # Send updated APL document with new metadata, or the cover's
+            # placeholders once they are known (they come after the track).
+            if changed or apl.placeholders_pending(metadata, _device_id_from(handler_input)):
                 try:
-                    util.update_apl_metadata(handler_input.response_builder)
+                    util.update_apl_metadata(handler_input.response_builder, metadata,
+                                             _device_id_from(handler_input))
                     logger.info("APL metadata update directive added to response")
                 except Exception:
                     logger.exception("Failed to update APL metadata")
 
-        # Always schedule the next refresh so polling continues.
+        # Always schedule the next refresh so polling continues; the delay
+        # backs off while nothing changes.
         try:
-            util.schedule_apl_refresh(handler_input.response_builder)
+            delay_ms = refresh_schedule.next_delay_ms(_device_id_from(handler_input), changed,
+                                                      result.get('now_playing'))
+            util.schedule_apl_refresh(handler_input.response_builder, delay_ms=delay_ms)
         except Exception:
             logger.exception("Failed to schedule APL refresh")
 
         # Explicitly keep session open to allow continued UserEvents
         return handler_input.response_builder.set_should_end_session(False).response
 
+
+class LoadIndexListDataHandler(AbstractRequestHandler):
+    """Handler for the queue overlay's LoadIndexListData requests.
+
+    The device asks for the queue items it is about to show; answer with
+    that page (from queue_view's cache when possible) and the queue length
+    as the list's upper bound. Without MA the list is closed empty.
+    """
+    def can_handle(self, handler_input):
+        # type: (HandlerInput) -> bool
+        return (is_request_type("Alexa.Presentation.APL.LoadIndexListData")(handler_input) and
+                handler_input.request_envelope.request.list_id == apl.QUEUE_LIST_ID)
+
+    def handle(self, handler_input):
+        # type: (HandlerInput) -> Response
+        request = handler_input.request_envelope.request
+        start = max(request.start_index or 0, 0)
+        result = queue_view.page(_player_id_from(handler_input), start, request.count)
+        items, total = result if result is not None else ([], start)
+        handler_input.response_builder.add_directive(SendIndexListDataDirective(
+            correlation_token=request.correlation_token,
+            list_id=request.list_id,
+            start_index=start,
+            minimum_inclusive_index=0,
+            maximum_exclusive_index=max(total, start + len(items)),
+            items=items))
+        return handler_input.response_builder.set_should_end_session(False).response
+
 # ###################################################################
 
 # ########## PLAYBACK CONTROLLER INTERFACE HANDLERS #################
@@ -644,7 +767,8 @@ class PlayCommandHandler(AbstractRequestHandler):
         logger.info("In PlayCommandHandler")
         _ = handler_input.attributes_manager.request_attributes["_"]
         request = handler_input.request_envelope.request
-        url, _audio = _get_stream_url(request)
+        player_id = _player_id_from(handler_input)
+        url, _audio = _get_stream_url(request, player_id)
         if not url:
             logger.warning("No stream url available for PlayCommand; notifying user")
             handler_input.response_builder.speak(
@@ -656,7 +780,9 @@ class PlayCommandHandler(AbstractRequestHandler):
             offset=0,
             text=None,
             response_builder=handler_input.response_builder,
-            supports_apl=supports_apl
+            supports_apl=supports_apl,
+            player_id=player_id,
+            viewport_class=_viewport_class_from(handler_input)
         )
 
 
@@ -819,6 +945,15 @@ class ResponseLogger(AbstractResponseInterceptor):
         # type: (HandlerInput, Response) -> None
         logger.debug("Alexa Response: {}".format(response))
 
+
+class APLDisplayedResponseInterceptor(AbstractResponseInterceptor):
+    """Record what a device shows once a response renders a new APL document there."""
+    def process(self, handler_input, response):
+        # type: (HandlerInput, Response) -> None
+        for directive in getattr(response, 'directives', None) or []:
+            if isinstance(directive, RenderDocumentDirective):
+                apl.note_rendered(_device_id_from(handler_input), directive)
+
 # ###################################################################
 
 
@@ -831,6 +966,7 @@ sb.add_request_handler(PlayCommandHandler())
 sb.add_request_handler(HelpIntentHandler())
 sb.add_request_handler(ExceptionEncounteredHandler())
 sb.add_request_handler(APLUserEventHandler())
+sb.add_request_handler(LoadIndexListDataHandler())
 sb.add_request_handler(UnhandledIntentHandler())
 sb.add_request_handler(NextOrPreviousIntentHandler())
 sb.add_request_handler(NextOrPreviousCommandHandler())
@@ -854,6 +990,7 @@ sb.add_global_request_interceptor(APLSupportRequestInterceptor())
 sb.add_global_request_interceptor(RequestLogger())
 sb.add_global_request_interceptor(LocalizationInterceptor())
 sb.add_global_response_interceptor(ResponseLogger())
+sb.add_global_response_interceptor(APLDisplayedResponseInterceptor())
 
 # AWS Lambda handler
 lambda_handler = sb.lambda_handler()
@@ -17,10 +17,13 @@ for these unconditionally.
 
 import asyncio
 import logging
+from contextlib import asynccontextmanager
+import socket
 import threading
 import time
 
 import aiohttp
+from aiohttp.abc import AbstractResolver
 from music_assistant_client import MusicAssistantClient
 from music_assistant_client.exceptions import (
     CannotConnect,
@@ -30,6 +33,8 @@ from music_assistant_client.exceptions import (
 from music_assistant_models.errors import MusicAssistantError
 
 from env_secrets import get_env_secret
+import dns_cache
+import latency
 
 logger = logging.getLogger(__name__)
 
@@ -82,26 +87,54 @@ async def _play_relative_index(client, player_id, offset):
     await client.player_queues.play_index(queue.queue_id, target_index)
 
 
-async def _send_command(server_url, token, player_id, command):
-    async with aiohttp.ClientSession() as session:
+class _CachedResolver(AbstractResolver):
+    """aiohttp resolver backed by the shared in-process DNS cache.
+
+    Each command opens a fresh session, so aiohttp's own per-connector
+    cache would never be reused between commands.
+    """
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        loop = asyncio.get_running_loop()
+        infos = await loop.run_in_executor(
+            None, dns_cache.resolve, host, port, family, socket.SOCK_STREAM)
+        return [
+            {"hostname": host, "host": sockaddr[0], "port": sockaddr[1],
+             "family": af, "proto": proto, "flags": socket.AI_NUMERICHOST}
+            for af, _type, proto, _canonname, sockaddr in infos
+        ]
+
+    async def close(self):
+        pass
+
+
+@asynccontextmanager
+async def _connect(server_url, token):
+    connector = aiohttp.TCPConnector(resolver=_CachedResolver())
+    async with aiohttp.ClientSession(connector=connector) as session:
         async with MusicAssistantClient(server_url, session, token=token) as client:
-            if command == "next":
-                await client.players.next_track(player_id)
-            elif command == "previous":
-                await _play_relative_index(client, player_id, -1)
-            elif command == "start_over":
-                await _play_relative_index(client, player_id, 0)
-            elif command == "pause":
-                await client.players.pause(player_id)
-            elif command == "stop":
-                await client.players.stop(player_id)
-            elif command == "resume":
-                # Not players.resume(): the alexa provider only overrides
-                # play(), which is what speaks the AMAZON.ResumeIntent
-                # utterance back into the device.
-                await client.players.play(player_id)
-            else:
-                raise ValueError(f"Unsupported MA command: {command}")
+            yield client
+
+
+async def _send_command(server_url, token, player_id, command):
+    async with _connect(server_url, token) as client:
+        if command == "next":
+            await client.players.next_track(player_id)
+        elif command == "previous":
+            await _play_relative_index(client, player_id, -1)
+        elif command == "start_over":
+            await _play_relative_index(client, player_id, 0)
+        elif command == "pause":
+            await client.players.pause(player_id)
+        elif command == "stop":
+            await client.players.stop(player_id)
+        elif command == "resume":
+            # Not players.resume(): the alexa provider only overrides
+            # play(), which is what speaks the AMAZON.ResumeIntent
+            # utterance back into the device.
+            await client.players.play(player_id)
+        else:
+            raise ValueError(f"Unsupported MA command: {command}")
 
 
 def send_player_command(player_id, command):
@@ -120,9 +153,15 @@ def send_player_command(player_id, command):
         logger.error("MA_API_URL is not set; cannot send %s command to MA", command)
         return False
 
+    timeout = latency.timeout_for("ma_command", server_url)
     try:
-        asyncio.run(_send_command(server_url, token, player_id, command))
+        with latency.measure("ma_command", server_url):
+            asyncio.run(asyncio.wait_for(
+                _send_command(server_url, token, player_id, command), timeout))
         return True
+    except asyncio.TimeoutError:
+        logger.error("Music Assistant did not complete %s for player %s within %.1fs", command, player_id, timeout)
+        return False
     except (CannotConnect, ConnectionFailed, InvalidServerVersion) as e:
         logger.error("Could not connect to Music Assistant at %s: %s", server_url, e)
         return False
@@ -132,3 +171,58 @@ def send_player_command(player_id, command):
     except Exception:
         logger.exception("Unexpected error sending %s command to MA player %s", command, player_id)
         return False
+
+
+async def _queue_page(server_url, token, player_id, offset, limit, image_size):
+    async with _connect(server_url, token) as client:
+        queue = await client.player_queues.get_active_queue(player_id)
+        if queue is None:
+            return None
+        items = await client.player_queues.get_queue_items(queue.queue_id, limit=limit, offset=offset) if limit else []
+        page = []
+        for item in items or []:
+            media_item = item.media_item
+            artists = getattr(media_item, "artists", None) or []
+            page.append({
+                # QueueItem.name is "artist - title"; prefer the track's own name.
+                "title": getattr(media_item, "name", None) or item.name,
+                "artist": ", ".join(a.name for a in artists if getattr(a, "name", None)),
+                "image_url": client.get_media_item_image_url(item, size=image_size),
+            })
+        return {
+            "queue_id": queue.queue_id,
+            # Changes whenever items are added, removed or moved.
+            "version": f"{queue.items_last_updated}:{queue.items}",
+            "total": queue.items,
+            "current_index": queue.current_index,
+            "items": page,
+        }
+
+
+def fetch_queue_page(player_id, offset, limit, image_size=256):
+    """Return a page of the player's active MA queue, or None if unavailable.
+
+    The result has queue_id, version, total, current_index and items
+    (title, artist, image_url - an MA image URL of about image_size pixels,
+    or None). With limit 0 only the queue itself is read (one MA call), to
+    check its version.
+    """
+    server_url = get_env_secret("MA_API_URL")
+    token = get_env_secret("MA_API_TOKEN")
+    if not server_url or not player_id:
+        return None
+
+    timeout = latency.timeout_for("ma_command", server_url)
+    try:
+        with latency.measure("ma_command", server_url):
+            return asyncio.run(asyncio.wait_for(
+                _queue_page(server_url, token, player_id, offset, limit, image_size), timeout))
+    except asyncio.TimeoutError:
+        logger.error("Music Assistant did not return the queue for player %s within %.1fs", player_id, timeout)
+    except (CannotConnect, ConnectionFailed, InvalidServerVersion) as e:
+        logger.error("Could not connect to Music Assistant at %s: %s", server_url, e)
+    except MusicAssistantError as e:
+        logger.error("Music Assistant rejected the queue request for player %s: %s", player_id, e)
+    except Exception:
+        logger.exception("Unexpected error fetching the MA queue for player %s", player_id)
+    return None
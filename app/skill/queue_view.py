@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Pages of the MA player queue for the APL queue view.
+
+The document binds the queue list to a dynamicIndexList datasource that
+starts empty; the device sends Alexa.Presentation.APL.LoadIndexListData
+for the items it is about to show, and LoadIndexListDataHandler answers
+with page(). A page is fetched from MA once per queue version (MA's
+items_last_updated and item count) and kept in a small LRU, so scrolling
+back and forth through a long queue, or several Echo Shows browsing the
+same queue, does not go back to MA. The queue's id and version are
+remembered per player (and forgotten on every push, which usually means
+the queue moved on), and pages of that version are answered from the LRU.
+Queue edits that MA does not push are picked up by re-checking the
+version, without the items, in the background when it is older than
+QUEUE_VIEW_RECHECK_SECONDS; the device keeps getting cached pages
+meanwhile, and only a changed version sends page requests back to MA.
+
+Item artwork is served through the artwork proxy's thumb variant when it
+is enabled.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from . import ma_control, util
+
+_app_src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _app_src not in sys.path:
+    sys.path.insert(0, _app_src)
+
+import artwork_cache
+import event_bus
+import shared_store
+import singleflight
+from env import float_env
+
+logger = logging.getLogger(__name__)
+
+# Devices ask for what fits on screen plus some lookahead; cap what one
+# request can pull from MA.
+_MAX_PAGE = 50
+_PAGES_MAX = 128
+_IMAGE_SIZE = artwork_cache.VARIANTS['thumb']
+
+_lock = threading.Lock()
+# player id -> (monotonic time the version was last confirmed, queue id, version, total)
+_queues = {}
+# (queue id, version, start, count) -> (APL list items, total)
+_pages = OrderedDict()
+# Players whose queue version is being re-checked.
+_checking = set()
+_stats = {'hits': 0, 'misses': 0, 'errors': 0, 'rechecks': 0, 'changed': 0}
+
+
+def _recheck_after():
+    return float_env('QUEUE_VIEW_RECHECK_SECONDS', 5)
+
+
+def player_for(player_id):
+    """The player whose queue to show: the mapped one, else the last pushed one."""
+    if player_id:
+        return player_id
+    latest = shared_store.get_latest(None)
+    return latest.player_id if latest is not None else None
+
+
+def _list_items(items):
+    hostname = util.get_ma_hostname(raise_on_http_scheme=False)
+    images = artwork_cache.public_urls(
+        [(item['image_url'], util.replace_ip_in_url(item['image_url'], hostname) or '') for item in items],
+        variant='thumb')
+    return [{
+        "primaryText": item['title'] or '',
+        "secondaryText": item['artist'] or '',
+        "imageThumbnailSource": image,
+    } for item, image in zip(items, images)]
+
+
+def _fetch(player_id, start, count):
+    result = ma_control.fetch_queue_page(player_id, start, count, image_size=_IMAGE_SIZE)
+    if result is None:
+        return None
+    key = (result['queue_id'], result['version'], start, count)
+    items = _list_items(result['items'])
+    with _lock:
+        _queues[player_id] = (time.monotonic(), result['queue_id'], result['version'], result['total'])
+        _pages[key] = (items, result['total'])
+        _pages.move_to_end(key)
+        while len(_pages) > _PAGES_MAX:
+            _pages.popitem(last=False)
+    return items, result['total']
+
+
+def _recheck(player_id, known):
+    try:
+        result = ma_control.fetch_queue_page(player_id, 0, 0)
+    except Exception:
+        logger.exception("Failed to check the MA queue version for player %s", player_id)
+        result = None
+    with _lock:
+        _checking.discard(player_id)
+        _stats['rechecks'] += 1
+        # Keep what is known if MA is unreachable, or a push or a page fetch got here first.
+        if result is None or _queues.get(player_id) is not known:
+            return
+        if (result['queue_id'], result['version']) != known[1:3]:
+            _stats['changed'] += 1
+        _queues[player_id] = (time.monotonic(), result['queue_id'], result['version'], result['total'])
+
+
+def _start_recheck(player_id, known):
+    """Re-check the queue version in the background if it is due; call with _lock held."""
+    if player_id in _checking or time.monotonic() - known[0] < _recheck_after():
+        return
+    _checking.add(player_id)
+    threading.Thread(target=_recheck, args=(player_id, known), daemon=True).start()
+
+
+def page(player_id, start, count):
+    """Return (items, total) for queue positions [start, start + count), or None if MA is unavailable."""
+    player_id = player_for(player_id)
+    if not player_id:
+        return None
+    start = max(int(start or 0), 0)
+    count = min(max(int(count or 0), 1), _MAX_PAGE)
+    with _lock:
+        known = _queues.get(player_id)
+        if known is not None:
+            key = (known[1], known[2], start, count)
+            cached = ([], known[3]) if start >= known[3] else _pages.get(key)
+            if cached is not None:
+                if cached[0]:
+                    _pages.move_to_end(key)
+                _stats['hits'] += 1
+                _start_recheck(player_id, known)
+                return cached
+        _stats['misses'] += 1
+    try:
+        result = singleflight.do(('queue_page', player_id, start, count), _fetch, player_id, start, count)
+    except Exception:
+        logger.exception("Failed to load the MA queue page for player %s", player_id)
+        result = None
+    if result is None:
+        with _lock:
+            _stats['errors'] += 1
+    return result
+
+
+def _on_now_playing(snapshot):
+    with _lock:
+        if snapshot.player_id:
+            _queues.pop(snapshot.player_id, None)
+        else:
+            _queues.clear()
+
+
+event_bus.subscribe(event_bus.NOW_PLAYING, _on_now_playing)
+
+
+def stats():
+    with _lock:
+        return dict(_stats, players=len(_queues), pages=len(_pages))
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Adaptive delay between APL MetadataRefresh UserEvents.
+
+Each refresh response schedules the next one (util.schedule_apl_refresh),
+so the delay chosen here sets how often every Echo Show calls back while
+music plays. It starts at APL_REFRESH_MIN_MS after a device sees a new
+version and doubles per unchanged refresh up to APL_REFRESH_MAX_MS. When
+MA reports the track's duration and position, the next refresh is pulled
+in to just after the expected end of the track, and kept short for a
+while after it until the next track's push arrives. When the total
+refresh rate across devices exceeds APL_REFRESH_TARGET_PER_SECOND, all
+delays are stretched by the same factor.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+from env import int_env
+
+# Requests are counted over this many seconds for the rates.
+_RATE_WINDOW = 60.0
+# Ask this long after the expected end of a track (MA pushes the next one at the transition).
+_TRACK_END_MARGIN_MS = 1500
+# Keep polling quickly for this long past the expected end of a track.
+_TRACK_END_GRACE_SECONDS = 20.0
+_DEVICES_MAX = 256
+
+_lock = threading.Lock()
+_devices = OrderedDict()
+_all_requests = deque()
+
+
+class _Device:
+    __slots__ = ('delay_ms', 'requests', 'last_delay_ms')
+
+    def __init__(self):
+        self.delay_ms = None
+        self.requests = deque()
+        self.last_delay_ms = None
+
+
+def _trim(times, now):
+    while times and times[0] < now - _RATE_WINDOW:
+        times.popleft()
+
+
+def _load_factor(now):
+    rate = len(_all_requests) / _RATE_WINDOW
+    return max(1.0, rate / int_env('APL_REFRESH_TARGET_PER_SECOND', 20))
+
+
+def next_delay_ms(device_id, changed, now_playing=None):
+    """Record a refresh from device_id and return the delay (ms) until its next one."""
+    min_ms = int_env('APL_REFRESH_MIN_MS', 1000)
+    max_ms = max(int_env('APL_REFRESH_MAX_MS', 16000), min_ms)
+    now = time.monotonic()
+    with _lock:
+        device = _devices.pop(device_id, None) or _Device()
+        _devices[device_id] = device
+        while len(_devices) > _DEVICES_MAX:
+            _devices.popitem(last=False)
+        device.requests.append(now)
+        _trim(device.requests, now)
+        _all_requests.append(now)
+        _trim(_all_requests, now)
+
+        if changed or device.delay_ms is None:
+            device.delay_ms = min_ms
+        else:
+            device.delay_ms = min(device.delay_ms * 2, max_ms)
+        load = _load_factor(now)
+        delay = device.delay_ms
+
+    if now_playing is not None:
+        remaining = now_playing.remaining(time.time())
+        if remaining is not None:
+            if remaining > 0:
+                delay = min(delay, remaining * 1000 + _TRACK_END_MARGIN_MS)
+            elif remaining > -_TRACK_END_GRACE_SECONDS:
+                delay = min(delay, 2 * min_ms)
+
+    delay = int(max(delay, min_ms) * load)
+    with _lock:
+        device.last_delay_ms = delay
+    return delay
+
+
+def stats():
+    """Return refresh rates (per minute) overall and per device, plus the current load factor."""
+    now = time.monotonic()
+    with _lock:
+        _trim(_all_requests, now)
+        devices = {}
+        for device_id, device in _devices.items():
+            _trim(device.requests, now)
+            if device.requests:
+                # Device ids are long and opaque; the tail identifies them on the /devices page.
+                devices['...' + (device_id or '')[-12:]] = {
+                    'per_minute': round(len(device.requests) * 60 / _RATE_WINDOW, 1),
+                    'next_delay_ms': device.last_delay_ms,
+                }
+        return {
+            'per_minute': round(len(_all_requests) * 60 / _RATE_WINDOW, 1),
+            'load_factor': round(_load_factor(now), 2),
+            'devices': devices,
+        }
@@ -6,7 +6,10 @@ import re
 import logging
 import threading
 import requests
-from env_secrets import get_env_secret
+import event_bus
+import latency
+import shared_store
+import singleflight
 from typing import Dict, Optional
 from ask_sdk_model import Request, Response
 from ask_sdk_model.ui import StandardCard, Image
@@ -18,8 +21,11 @@ from ask_sdk_core.response_helper import ResponseFactory
 from ask_sdk_core.handler_input import HandlerInput
 from ask_sdk_model.interfaces.alexa.presentation.apl import ExecuteCommandsDirective, ControlMediaCommand, MediaCommandType
 from . import data
-from .apl import add_apl
+from .apl import add_apl, metadata_commands
 
+# How late a scheduled refresh's response may be (Alexa allows the skill 8s)
+# before the document's watchdog sends a new refresh.
+_REFRESH_RESPONSE_GRACE_MS = 10000
 
 def apl_enabled():
     return os.environ.get('ENABLE_APL', 'false').lower() in ('true', '1', 'yes')
@@ -75,49 +81,51 @@ def get_ma_hostname(raise_on_http_scheme=True):
 def replace_ip_in_url(url, hostname):
     if not url:
         return url
+    # Pushed records already carry public URLs; skip the regex for them.
+    if hostname and url.startswith(hostname) and ' ' not in url:
+        return url
     try:
         new_url = re.sub(r'^https?://\d+\.\d+\.\d+\.\d+(?::\d+)?', hostname, url)
     except re.error:
         return url.replace(' ', '%20')
     return new_url.replace(' ', '%20')
 
-def audio_data(request):
+def audio_data(request, player_id=None):
     try:
-        data.get_latest()
-        return data.info
+        return data.get_latest(player_id=player_id).get('info', data.info)
     except Exception:
         return
 
 
-def push_alexa_metadata(url):
+def push_alexa_metadata(url, metadata=None):
+    metadata = metadata or data.info
     payload = {
         'streamUrl': url,
-        'title': data.info.get("primaryText"),
-        'secondary': data.info.get("secondaryText"),
-        'imageUrl': data.info.get("coverImageSource")
+        'title': metadata.get("primaryText"),
+        'secondary': metadata.get("secondaryText"),
+        'imageUrl': metadata.get("coverImageSource")
     }
 
-    try:
-        from app.alexa_api import alexa_routes
-        alexa_routes._store = payload
-    except Exception:
-        try:
-            push_endpoint = 'http://localhost:5000/alexa/push-url'
-            user = get_env_secret('APP_USERNAME')
-            pwd = get_env_secret('APP_PASSWORD')
-            if user and pwd:
-                requests.post(push_endpoint, json=payload, timeout=2, auth=(user, pwd))
-            else:
-                requests.post(push_endpoint, json=payload, timeout=2)
-        except requests.RequestException:
-            logging.exception('Failed to POST to Alexa API %s', push_endpoint)
-        except Exception:
-            logging.exception('Unexpected error while pushing Alexa metadata')
+    # /alexa/latest-url (alexa_routes) subscribes to this in-process.
+    event_bus.publish(event_bus.ALEXA_NOW_PLAYING, payload)
 
 
-def play(url, offset, text, response_builder, supports_apl=False):
+def _probe_stream_url(url):
+    """Return the HTTP status of the stream URL (HEAD, falling back to GET)."""
+    timeout = latency.timeout_for('stream_probe', url)
+    with latency.measure('stream_probe', url):
+        head_resp = requests.head(url, allow_redirects=True, timeout=timeout)
+    if head_resp.status_code < 400:
+        return head_resp.status_code
+    with latency.measure('stream_probe', url):
+        resp = requests.get(url, stream=True, allow_redirects=True, timeout=timeout)
+    resp.close()
+    return resp.status_code
+
+
+def play(url, offset, text, response_builder, supports_apl=False, player_id=None, viewport_class=None):
     if supports_apl and apl_enabled():
-        add_apl(response_builder)
+        add_apl(response_builder, player_id=player_id, viewport_class=viewport_class)
     else:
         try:
             hostname = get_ma_hostname(raise_on_http_scheme=True)
@@ -139,13 +147,17 @@ def play(url, offset, text, response_builder, supports_apl=False):
             logging.info('Stream URL (validation skipped via SKIP_URL_VALIDATION): %s', url)
         else:
             try:
-                head_resp = requests.head(url, allow_redirects=True, timeout=5)
-                resp = head_resp
-                if head_resp.status_code >= 400:
-                    resp = requests.get(url, stream=True, allow_redirects=True, timeout=5)
-
-                if resp.status_code >= 400:
-                    logging.error('Audio URL returned HTTP %s: %s', resp.status_code, url)
+                # A URL that probed fine recently (possibly before a restart)
+                # is not probed again.
+                status_code = shared_store.validated_status(url)
+                if status_code is None:
+                    # Grouped Echo devices launch together; probe each URL once.
+                    status_code = singleflight.do(('stream_probe', url), _probe_stream_url, url)
+                    if status_code < 400:
+                        shared_store.record_validation(url, status_code)
+
+                if status_code >= 400:
+                    logging.error('Audio URL returned HTTP %s: %s', status_code, url)
                     response_builder.speak(
                         "Sorry, I can't reach the audio file. Please check that your stream URL is internet accessible via HTTPS at the MA_HOSTNAME variable you provided.")
                     response_builder.set_should_end_session(True)
@@ -176,7 +188,7 @@ def play(url, offset, text, response_builder, supports_apl=False):
         response_builder.speak(text)
 
     try:
-        push_alexa_metadata(url)
+        push_alexa_metadata(url, audio_data(None, player_id))
     except Exception:
         logging.exception('Error while preparing Alexa API push payload')
 
@@ -226,12 +238,13 @@ def stop(text, response_builder, supports_apl=False):
     return response_builder.response
 
 
-def pause(text, response_builder, supports_apl=False, session_new=False):
+def pause(text, response_builder, supports_apl=False, session_new=False, player_id=None, viewport_class=None):
     if supports_apl and apl_enabled():
         try:
             if session_new:
                 try:
-                    add_apl(response_builder, start_paused=True)
+                    add_apl(response_builder, start_paused=True, player_id=player_id,
+                            viewport_class=viewport_class)
                 except Exception:
                     logging.exception('Failed to re-render APL on session new')
                 response_builder.set_should_end_session(False)
@@ -262,79 +275,24 @@ def clear(response_builder):
     return response_builder.response
 
 
-def update_apl_metadata(response_builder):
+def update_apl_metadata(response_builder, metadata=None, device_id=None):
     """Update the APL document with the latest metadata without interrupting playback.
 
-    This function sends ExecuteCommands directives to update only the text and image
-    components, avoiding a full document re-render that would restart audio playback.
+    This function sends an ExecuteCommands directive that sets the metadata
+    parameters bound on the AudioPlayer root (see apl.metadata_commands);
+    every component showing them re-evaluates, so there is no full document
+    re-render that would restart audio playback.
     This is called in response to UserEvent requests from the APL document.
+    `metadata` is the requesting device's player info (defaults to data.info).
+    With the requesting `device_id`, only values that device is not already
+    showing are sent, and no directive at all when nothing differs.
     """
     if not apl_enabled():
         return
+    metadata = metadata or data.info
     try:
-        # Replace MA-hosted image sources if MA_HOSTNAME is set
-        try:
-            hostname = get_ma_hostname(raise_on_http_scheme=False)
-        except ValueError:
-            hostname = ''
-
-        cover_image = data.info.get("coverImageSource", "")
-        background_image = data.info.get("backgroundImageSource", "")
-
-        if hostname:
-            cover_image = replace_ip_in_url(cover_image, hostname)
-            background_image = replace_ip_in_url(background_image, hostname)
-
-        # Build SetValue commands to update individual components
-        commands = []
-
-        # Update primary text (song title)
-        if data.info.get("primaryText"):
-            commands.append({
-                "type": "SetValue",
-                "componentId": "Audio_PrimaryText",
-                "property": "text",
-                "value": data.info["primaryText"]
-            })
-
-        # Update secondary text (artist/album)
-        if data.info.get("secondaryText"):
-            commands.append({
-                "type": "SetValue",
-                "componentId": "Audio_SecondaryText",
-                "property": "text",
-                "value": data.info["secondaryText"]
-            })
-
-        # Update cover image and bound data so conditional rendering refreshes.
-        if cover_image:
-            commands.append({
-                "type": "SetValue",
-                "componentId": "AudioPlayerRoot",
-                "property": "coverImageSource",
-                "value": cover_image
-            })
-            commands.append({
-                "type": "SetValue",
-                "componentId": "Audio_CoverArt",
-                "property": "imageSource",
-                "value": cover_image
-            })
-
-        # Update background image and bound data so layouts recompute.
-        if background_image:
-            commands.append({
-                "type": "SetValue",
-                "componentId": "AudioPlayerRoot",
-                "property": "backgroundImageSource",
-                "value": background_image
-            })
-            commands.append({
-                "type": "SetValue",
-                "componentId": "AlexaBackground",
-                "property": "backgroundImageSource",
-                "value": background_image
-            })
+        # Image URLs were made public when the record was pushed.
+        commands = metadata_commands(metadata, device_id)
 
         # Send ExecuteCommands directive if we have any commands
         if commands:
@@ -344,6 +302,8 @@ def update_apl_metadata(response_builder):
                     token="playbackToken"
                 )
             )
+        elif device_id is not None:
+            logging.debug("Device already shows this metadata; no SetValue commands")
         else:
             logging.warning("No SetValue commands generated - no metadata to update")
 
@@ -354,15 +314,25 @@ def update_apl_metadata(response_builder):
 def schedule_apl_refresh(response_builder, delay_ms=1000):
     """Schedule the next APL metadata refresh via a UserEvent.
 
-    This keeps refreshes alive even if the onMount loop does not repeat.
+    The document's onMount sends only the first refresh; every refresh
+    response schedules the next one (see refresh_schedule for the delay)
+    and moves the document's watchdog deadline (refreshDueAt) past it, so
+    the watchdog only restarts refreshes once a response went missing.
     """
     if not apl_enabled():
         return
     try:
+        delay_ms = int(delay_ms)
         commands = [
+            {
+                "type": "SetValue",
+                "componentId": "PlayerScreen",
+                "property": "refreshDueAt",
+                "value": f"${{elapsedTime + {delay_ms} + {_REFRESH_RESPONSE_GRACE_MS}}}"
+            },
             {
                 "type": "Idle",
-                "delay": int(delay_ms)
+                "delay": delay_ms
             },
             {
                 "type": "SendEvent",
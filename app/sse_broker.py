@@ -0,0 +1,169 @@
+"""Server-Sent Events fan-out of shared_store updates (/ma/events).
+
+Every NowPlaying published in this process is formatted once, kept in a
+short history ring and offered to each connected client's bounded queue.
+A client whose queue is full is too slow to keep up: it is dropped, and
+its EventSource reconnects with Last-Event-ID and resumes from the
+history ring (or gets the current record if it fell further behind).
+
+Events only reach streams in the process that published them. For
+records published by other workers (SQLite store backend) each stream
+also re-checks shared_store every second and sends the current record if
+it is newer than what the client has; intermediate records published
+elsewhere within that second are skipped.
+
+The built-in server and typical WSGI deployments hold one thread per open
+stream, so streams are limited in number (SSE_MAX_SUBSCRIBERS) and
+length (SSE_MAX_STREAM_SECONDS; clients reconnect transparently). Idle
+streams send a comment line every SSE_HEARTBEAT_SECONDS, which also
+notices closed connections.
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+import event_bus
+import shared_store
+from env import int_env
+
+_QUEUE_SIZE = 16
+_HISTORY_SIZE = 64
+_RETRY_MS = 3000
+_RECHECK_SECONDS = 1.0
+
+_lock = threading.Lock()
+_clients = set()
+_history = deque(maxlen=_HISTORY_SIZE)
+_stats = {'opened': 0, 'rejected': 0, 'dropped_slow': 0, 'expired': 0, 'events': 0}
+
+
+class _Client:
+    __slots__ = ('queue', 'player_id', 'overflowed')
+
+    def __init__(self, player_id):
+        self.queue = queue.Queue(maxsize=_QUEUE_SIZE)
+        self.player_id = player_id
+        self.overflowed = False
+
+
+def _format(snapshot):
+    return (f"id: {snapshot.version}\nevent: now_playing\n"
+            f"data: {json.dumps(snapshot.to_dict(), separators=(',', ':'))}\n\n")
+
+
+def _wants(player_id, snapshot):
+    return player_id is None or snapshot.player_id == player_id
+
+
+def _on_now_playing(snapshot):
+    message = (snapshot.version, snapshot.player_id, _format(snapshot))
+    with _lock:
+        _history.append(message)
+        _stats['events'] += 1
+        clients = list(_clients)
+    for client in clients:
+        if not _wants(client.player_id, snapshot):
+            continue
+        try:
+            client.queue.put_nowait(message)
+        except queue.Full:
+            client.overflowed = True
+            with _lock:
+                if client in _clients:
+                    _clients.discard(client)
+                    _stats['dropped_slow'] += 1
+
+
+event_bus.subscribe(event_bus.NOW_PLAYING, _on_now_playing)
+
+
+def _backlog(player_id, last_event_id):
+    """Messages a (re)connecting client should get before live events."""
+    with _lock:
+        history = [m for m in _history if player_id is None or m[1] == player_id]
+    if last_event_id is not None and history and history[0][0] <= last_event_id + 1:
+        return [m for m in history if m[0] > last_event_id]
+    current = shared_store.get_latest(player_id)
+    if current is None or (last_event_id is not None and current.version <= last_event_id):
+        return []
+    return [(current.version, current.player_id, _format(current))]
+
+
+class _Stream:
+    """WSGI response iterable for one client; closing it frees the subscriber slot.
+
+    The WSGI server calls close() even when the body is never iterated
+    (HEAD, or a client gone before the first chunk), which a bare
+    generator's finally block would not see.
+    """
+
+    def __init__(self, client, chunks):
+        self._client = client
+        self._chunks = chunks
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        with _lock:
+            _clients.discard(self._client)
+        self._chunks.close()
+
+
+def _chunks(client, player_id, last_event_id):
+    heartbeat = int_env('SSE_HEARTBEAT_SECONDS', 15)
+    deadline = time.monotonic() + int_env('SSE_MAX_STREAM_SECONDS', 300)
+    last_sent = last_event_id if last_event_id is not None else -1
+    yield f"retry: {_RETRY_MS}\n\n"
+    for version, _player, text in _backlog(player_id, last_event_id):
+        last_sent = version
+        yield text
+    last_write = time.monotonic()
+    while not client.overflowed:
+        now = time.monotonic()
+        remaining = deadline - now
+        if remaining <= 0:
+            with _lock:
+                _stats['expired'] += 1
+            return
+        try:
+            version, _player, text = client.queue.get(timeout=min(_RECHECK_SECONDS, remaining))
+        except queue.Empty:
+            # Published by another worker?
+            current = shared_store.get_latest(player_id)
+            if current is not None and current.version > last_sent:
+                version, text = current.version, _format(current)
+            elif time.monotonic() - last_write >= heartbeat:
+                last_write = time.monotonic()
+                yield ": keepalive\n\n"
+                continue
+            else:
+                continue
+        if version > last_sent:
+            last_sent = version
+            last_write = time.monotonic()
+            yield text
+
+
+def open_stream(player_id=None, last_event_id=None):
+    """Return the SSE response iterable for one client, or None if the subscriber limit is reached."""
+    client = _Client(player_id)
+    with _lock:
+        if len(_clients) >= int_env('SSE_MAX_SUBSCRIBERS', 8):
+            _stats['rejected'] += 1
+            return None
+        # Registered before the backlog is read, so nothing published in between is lost.
+        _clients.add(client)
+        _stats['opened'] += 1
+    return _Stream(client, _chunks(client, player_id, last_event_id))
+
+
+def stats():
+    with _lock:
+        return dict(_stats, subscribers=len(_clients))
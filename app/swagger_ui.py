@@ -21,6 +21,9 @@ OPENAPI_SPEC: Dict[str, Any] = {
                                     "artist": {"type": "string"},
                                     "album": {"type": "string"},
                                     "imageUrl": {"type": "string"},
+                                    "playerId": {"type": "string", "description": "MA player id; keeps one record per player"},
+                                    "duration": {"type": "number", "description": "Track length in seconds"},
+                                    "elapsed": {"type": "number", "description": "Playback position in seconds at push time"},
                                 },
                                 "required": ["streamUrl"],
                             },
@@ -43,6 +46,16 @@ OPENAPI_SPEC: Dict[str, Any] = {
         "/ma/latest-url": {
             "get": {
                 "summary": "Get last pushed stream metadata",
+                "parameters": [
+                    {"name": "playerId", "in": "query", "required": False, "schema": {"type": "string"},
+                     "description": "Return this MA player's record instead of the most recent one"},
+                    {"name": "wait", "in": "query", "required": False, "schema": {"type": "number"},
+                     "description": "Long-poll: wait up to this many seconds for a record newer than `since`"},
+                    {"name": "since", "in": "query", "required": False, "schema": {"type": "integer"},
+                     "description": "Version the client already has (defaults to the If-None-Match ETag)"},
+                    {"name": "If-None-Match", "in": "header", "required": False, "schema": {"type": "string"},
+                     "description": "ETag from a previous response; 304 if the record is unchanged"}
+                ],
                 "responses": {
                     "200": {
                         "description": "ok",
@@ -59,10 +72,27 @@ OPENAPI_SPEC: Dict[str, Any] = {
                             }
                         },
                     },
+                    "304": {"description": "Not modified since the If-None-Match ETag"},
                     "404": {"description": "No URL available"},
                 },
             }
         },
+        "/ma/events": {
+            "get": {
+                "summary": "Stream now-playing updates (Server-Sent Events)",
+                "description": "Sends the current record, then one `now_playing` event per pushed version (`id` is the version). Reconnect with `Last-Event-ID` to resume.",
+                "parameters": [
+                    {"name": "playerId", "in": "query", "required": False, "schema": {"type": "string"},
+                     "description": "Only send this MA player's records"},
+                    {"name": "Last-Event-ID", "in": "header", "required": False, "schema": {"type": "integer"},
+                     "description": "Last version received; missed events are replayed"}
+                ],
+                "responses": {
+                    "200": {"description": "text/event-stream"},
+                    "503": {"description": "Too many event stream subscribers"},
+                },
+            }
+        },
         "/": {
             "post": {
                 "summary": "Invoke the Alexa skill (test)",
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Compare serialized APL directive sizes: metadata inlined vs bound from datasources.
+
+The baseline reproduces the previous directives: the RenderDocument with
+the metadata copied into the mainTemplate root item (and the template's
+description strings), and the refresh ExecuteCommands writing each value
+into the root item and again into the component that displays it. The
+current directives come from apl._build_directive() (what add_apl() renders)
+and apl.metadata_commands(); the render is also sized for each viewport class.
+"""
+import json
+import os
+
+from bench_helpers import load_app, push
+
+
+def size(obj):
+    return len(json.dumps(obj, separators=(',', ':')).encode('utf-8'))
+
+
+def main():
+    client = load_app()
+    push(client, 1, title='A Fairly Typical Song Title (Remastered)', album='Some Album Name (Deluxe Edition)')
+    from ask_sdk_core.serialize import DefaultSerializer
+    from ask_sdk_model.interfaces.alexa.presentation.apl import RenderDocumentDirective
+    from skill import apl
+
+    serializer = DefaultSerializer()
+    metadata, _snapshot = apl._get_metadata()
+
+    with open(os.path.join(os.path.dirname(apl.__file__), 'apl_document.json'), 'r') as f:
+        document = json.load(f)
+    document["mainTemplate"]["items"][0].update(metadata)
+    render_before = serializer.serialize(RenderDocumentDirective(
+        token="playbackToken", document=document, datasources={}))
+
+    render_after = serializer.serialize(apl._build_directive(metadata, True))
+
+    def set_value(component, prop, value):
+        return {"type": "SetValue", "componentId": component, "property": prop, "value": value}
+
+    refresh_before = {"type": "Alexa.Presentation.APL.ExecuteCommands", "token": "playbackToken", "commands": [
+        set_value("Audio_PrimaryText", "text", metadata["primaryText"]),
+        set_value("Audio_SecondaryText", "text", metadata["secondaryText"]),
+        set_value("AudioPlayerRoot", "coverImageSource", metadata["coverImageSource"]),
+        set_value("Audio_CoverArt", "imageSource", metadata["coverImageSource"]),
+        set_value("AudioPlayerRoot", "backgroundImageSource", metadata["backgroundImageSource"]),
+        set_value("AlexaBackground", "backgroundImageSource", metadata["backgroundImageSource"]),
+    ]}
+    refresh_after = {"type": "Alexa.Presentation.APL.ExecuteCommands", "token": "playbackToken",
+                     "commands": apl.metadata_commands(metadata)}
+
+    for label, before, after in (('render', render_before, render_after),
+                                 ('refresh', refresh_before, refresh_after)):
+        b, a = size(before), size(after)
+        print(f'{label:>8}: {b:6d} -> {a:6d} bytes ({(b - a) / b * 100:4.1f}% smaller)')
+
+    print('render per viewport class:')
+    for vclass, document_bytes in apl.document_sizes().items():
+        directive = apl._build_directive(metadata, True, None if vclass == 'default' else vclass)
+        print(f'{vclass:>12}: {size(serializer.serialize(directive)):6d} bytes (document {document_bytes})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""Measure response bytes per APL MetadataRefresh, changed vs unchanged.
+
+A refresh without a device id is treated as "always changed" (the old
+behaviour), so it serves as the baseline for the version-aware path.
+"""
+import sys
+
+from bench_helpers import load_app, metadata_refresh, post_skill, push
+
+REFRESHES = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+
+def main():
+    client = load_app()
+    push(client, 1)
+
+    baseline = [len(post_skill(client, metadata_refresh(device_id=None))) for _ in range(REFRESHES)]
+
+    post_skill(client, metadata_refresh())  # first refresh after a push carries the update
+    aware = [len(post_skill(client, metadata_refresh())) for _ in range(REFRESHES)]
+
+    push(client, 2)
+    changed = len(post_skill(client, metadata_refresh()))
+
+    avg_base = sum(baseline) / len(baseline)
+    avg_aware = sum(aware) / len(aware)
+    print(f'refreshes per case:          {REFRESHES}')
+    print(f'always-changed (baseline):   {avg_base:.0f} bytes/refresh')
+    print(f'version-aware, unchanged:    {avg_aware:.0f} bytes/refresh')
+    print(f'version-aware, after push:   {changed} bytes')
+    print(f'reduction when unchanged:    {100 * (1 - avg_aware / avg_base):.1f}%')
+
+
+if __name__ == '__main__':
+    main()
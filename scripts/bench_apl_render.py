@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Time APL RenderDocument construction: per-call template load vs cached template.
+
+The baseline reproduces the previous add_apl(): read and json.load the
+template on every render, then patch autoplay and the mainTemplate through
+fixed index paths. The cached path is the current apl.add_apl().
+"""
+import json
+import os
+import sys
+import timeit
+
+from bench_helpers import load_app, push
+
+RENDERS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+
+def main():
+    client = load_app()
+    push(client, 1)
+    from ask_sdk_core.response_helper import ResponseFactory
+    from ask_sdk_model.interfaces.alexa.presentation.apl import RenderDocumentDirective
+    from skill import apl
+
+    template_path = os.path.join(os.path.dirname(apl.__file__), 'apl_document.json')
+
+    def baseline():
+        metadata, _snapshot = apl._get_metadata()
+        with open(template_path, 'r') as f:
+            document = json.load(f)
+        layout = document["layouts"]["AudioPlayer"]["item"][0]["items"][2]["items"][1]
+        layout["items"][0]["autoplay"] = True
+        layout["items"][1]["items"][0]["item"][1]["autoplay"] = True
+        document["mainTemplate"]["items"][0].update(metadata)
+        ResponseFactory().add_directive(RenderDocumentDirective(
+            token="playbackToken", document=document, datasources={}))
+
+    def cached():
+        apl.add_apl(ResponseFactory())
+
+    for label, fn in (('per-call load', baseline), ('cached template', cached)):
+        fn()
+        seconds = timeit.timeit(fn, number=RENDERS)
+        print(f'{label:>16}: {seconds / RENDERS * 1e6:8.1f} us/render ({RENDERS} renders)')
+
+
+if __name__ == '__main__':
+    main()
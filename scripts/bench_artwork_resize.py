@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Resize local images into the artwork proxy's variants and report sizes and timings.
+
+Also times the dominant colour used as the APL placeholder.
+
+Usage: python scripts/bench_artwork_resize.py cover.jpg [more images...]
+Without arguments a synthetic 3000x3000 image is used. Needs Pillow.
+"""
+import os
+import sys
+import time
+from io import BytesIO
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, APP_DIR)
+
+import artwork_cache  # noqa: E402
+
+
+def synthetic():
+    from PIL import Image
+    image = Image.radial_gradient('L').resize((3000, 3000)).convert('RGB')
+    out = BytesIO()
+    image.save(out, 'JPEG', quality=95)
+    return 'synthetic 3000x3000', out.getvalue()
+
+
+def main():
+    if artwork_cache.Image is None:
+        sys.exit('Pillow is not installed')
+    sources = [synthetic()] if len(sys.argv) < 2 else []
+    for path in sys.argv[1:]:
+        with open(path, 'rb') as f:
+            sources.append((path, f.read()))
+    for label, data in sources:
+        print(f'{label}: {len(data)} bytes')
+        for variant, size in artwork_cache.VARIANTS.items():
+            start = time.perf_counter()
+            blur = artwork_cache._PREVIEW_BLUR if variant == 'preview' else 0
+            resized = artwork_cache.resize(data, size, blur=blur)
+            elapsed = (time.perf_counter() - start) * 1000
+            with artwork_cache.Image.open(BytesIO(resized)) as image:
+                dims = f'{image.width}x{image.height}'
+            print(f'  {variant:>10}: {dims:>9} {len(resized):8d} bytes ({len(resized) / len(data) * 100:5.1f}%) in {elapsed:6.1f} ms')
+        start = time.perf_counter()
+        color = artwork_cache.dominant_color(data)
+        print(f'  {"colour":>10}: {color:>9} in {(time.perf_counter() - start) * 1000:6.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
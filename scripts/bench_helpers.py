@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Shared setup for the bench_*.py scripts.
+
+Imports the Flask app from app/ in-process (no server, no Alexa signature
+checks: requests go through the simulator bypass) and builds minimal Alexa
+request envelopes. Run the benchmarks from the repository root inside the
+app's virtualenv, e.g. `python scripts/bench_apl_refresh.py`.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+
+
+def load_app(**env):
+    """Import app/app.py with benchmark-friendly defaults; return a test client."""
+    defaults = {
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'PORT': '5000',
+        'MA_HOSTNAME': 'ma.example.com',
+        'ENABLE_APL': 'true',
+        'SKIP_URL_VALIDATION': 'true',
+        'QUIET_HTTP': '1',
+        # Benchmarks push back-to-back and expect each push to apply.
+        'PUSH_COALESCE_WINDOW_SECONDS': '0',
+        'PUSH_RATE_LIMIT_PER_SECOND': '0',
+        'NOW_PLAYING_STATE_PATH': os.path.join(tempfile.mkdtemp(), 'now_playing.json'),
+    }
+    defaults.update(env)
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    os.chdir(APP_DIR)
+    import logging
+    logging.disable(logging.INFO)
+    import app as app_module
+    return app_module.app.test_client()
+
+
+def envelope(request, device_id='amzn1.ask.device.bench', apl=True, new=False, viewport=None):
+    interfaces = {'AudioPlayer': {}}
+    if apl:
+        interfaces['Alexa.Presentation.APL'] = {'runtime': {'maxVersion': '2024.3'}}
+    context = {
+        'System': {
+            'application': {'applicationId': ''},
+            'device': {'deviceId': device_id, 'supportedInterfaces': interfaces},
+        }
+    }
+    if viewport:
+        context['Viewport'] = viewport
+    body = {
+        'requestId': 'EdwRequestId.bench',
+        'locale': 'en-US',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+    body.update(request)
+    return {
+        'version': '1.0',
+        'session': {'new': new, 'sessionId': 'SessionId.bench',
+                    'application': {'applicationId': ''}, 'user': {'userId': 'amzn1.ask.account.bench'}},
+        'context': context,
+        'request': body,
+    }
+
+
+def metadata_refresh(**kwargs):
+    return envelope({'type': 'Alexa.Presentation.APL.UserEvent',
+                     'arguments': ['MetadataRefresh', 1], 'token': 'playbackToken'}, **kwargs)
+
+
+def launch(**kwargs):
+    return envelope({'type': 'LaunchRequest'}, **kwargs)
+
+
+def post_skill(client, payload):
+    """POST an envelope to the skill endpoint; return the raw response body bytes."""
+    resp = client.post('/', data=json.dumps(payload),
+                       headers={'Content-Type': 'application/json', 'X-Simulator-Signature': 'bench'})
+    return resp.get_data()
+
+
+def push(client, n=0, **fields):
+    body = {
+        'streamUrl': f'http://192.168.1.10:8097/flow/bench/{n}.mp3',
+        'title': f'Track {n}',
+        'artist': 'Bench Artist',
+        'album': 'Bench Album',
+        'imageUrl': f'http://192.168.1.10:8097/imageproxy?path=cover{n}.jpg',
+    }
+    body.update(fields)
+    return client.post('/ma/push-url', json=body).get_json()
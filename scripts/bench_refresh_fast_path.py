@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Time unchanged APL MetadataRefresh requests: full skill dispatch vs the fast path.
+
+"dispatch" is the skill work alone for one request body (verification is
+off in both cases, as with the simulator bypass): the full path
+deserializes the envelope, runs the interceptors and APLUserEventHandler
+and serializes the response; the fast path is skill.fast_refresh.respond().
+"end to end" is a POST through the Flask test client, including the app's
+before/after request hooks, with APL_FAST_REFRESH switched off and on.
+"""
+import json
+import os
+import sys
+import timeit
+
+from bench_helpers import load_app, metadata_refresh, post_skill, push
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+
+def per_request_us(fn):
+    fn()
+    return timeit.timeit(fn, number=REQUESTS) / REQUESTS * 1e6
+
+
+def main():
+    client = load_app()
+    push(client, 1)
+    payload = metadata_refresh()
+    post_skill(client, payload)  # the device has now seen the current version
+    body = json.dumps(payload)
+
+    from ask_sdk_webservice_support.webservice_handler import WebserviceSkillHandler
+    import app as app_module
+    from skill import apl, fast_refresh
+
+    handler = WebserviceSkillHandler(app_module.custom_skill, verify_signature=False,
+                                     verify_timestamp=False, verifiers=[])
+
+    def full_dispatch():
+        apl.to_json(handler.verify_request_and_dispatch(http_request_headers={}, http_request_body=body))
+
+    def fast_dispatch():
+        fast_refresh.respond(json.loads(body))
+
+    assert fast_refresh.respond(json.loads(body)) is not None, 'refresh not eligible for the fast path'
+    print(f'dispatch     full: {per_request_us(full_dispatch):8.1f} us/request')
+    print(f'dispatch     fast: {per_request_us(fast_dispatch):8.1f} us/request')
+
+    for label, enabled in (('full', 'false'), ('fast', 'true')):
+        os.environ['APL_FAST_REFRESH'] = enabled
+        print(f'end to end   {label}: {per_request_us(lambda: post_skill(client, payload)):8.1f} us/request')
+    print(f'({REQUESTS} requests per case)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Measure now-playing reads while writers hammer the shared store.
+
+Reader threads load metadata the way the skill does (data.get_latest) and
+check every snapshot for consistency: each published record carries the
+same sequence number in its stream URL and title, so a reader seeing a
+mix of two records counts as a torn read. Runs once with no writers as a
+baseline, then under a write storm. Set SHARED_STORE_BACKEND=sqlite to
+measure the multi-worker backend instead of the in-memory one.
+
+    python scripts/bench_store_concurrency.py [seconds] [readers] [writers]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from bench_helpers import APP_DIR
+
+SECONDS = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+READERS = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+WRITERS = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+
+def run(data, shared_store, writers):
+    stop = threading.Event()
+    reads = []
+    torn = []
+    writes = []
+
+    def reader():
+        count = bad = 0
+        latencies = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            result = data.get_latest(player_id='bench')
+            latencies.append(time.perf_counter() - started)
+            info = result.get('info') or {}
+            seq = info.get('audioSources', '').rsplit('/', 1)[-1].split('.')[0]
+            if info.get('primaryText') != f'Track {seq}':
+                bad += 1
+            count += 1
+        reads.append(latencies)
+        torn.append(bad)
+
+    def writer(offset):
+        n = 0
+        while not stop.is_set():
+            seq = offset + n * WRITERS
+            shared_store.publish({'streamUrl': f'https://ma.example.com/stream/{seq}.flac',
+                                  'title': f'Track {seq}', 'artist': 'Bench', 'album': 'Storm'},
+                                 player_id='bench')
+            n += 1
+        writes.append(n)
+
+    threads = [threading.Thread(target=reader) for _ in range(READERS)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(SECONDS)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies = sorted(x for per_thread in reads for x in per_thread)
+    p50 = latencies[len(latencies) // 2] * 1e6
+    p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1e6
+    return len(latencies) / SECONDS, p50, p99, sum(torn), sum(writes) / SECONDS
+
+
+def main():
+    # Keep benchmark records out of the real store and saved state.
+    tmp = tempfile.mkdtemp()
+    os.environ.setdefault('SHARED_STORE_PATH', os.path.join(tmp, 'store.sqlite3'))
+    os.environ.setdefault('NOW_PLAYING_STATE_PATH', os.path.join(tmp, 'now_playing.json'))
+    sys.path.insert(0, APP_DIR)
+    import logging
+    logging.disable(logging.WARNING)
+    import shared_store
+    from skill import data
+
+    shared_store.publish({'streamUrl': 'https://ma.example.com/stream/0.flac', 'title': 'Track 0'},
+                         player_id='bench')
+    print(f'backend: {type(shared_store._backend).__name__}, '
+          f'{READERS} readers, {SECONDS:.0f}s per case')
+    for label, writers in (('no writers', 0), (f'{WRITERS} writers', WRITERS)):
+        rate, p50, p99, torn, write_rate = run(data, shared_store, writers)
+        print(f'{label:>12}: {rate:>10,.0f} reads/s  p50 {p50:6.1f}us  p99 {p99:7.1f}us  '
+              f'torn {torn}  writes/s {write_rate:,.0f}')
+
+
+if __name__ == '__main__':
+    main()
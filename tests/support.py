@@ -0,0 +1,114 @@
+"""Shared setup for the tests.
+
+Run from the repository root inside the app's virtualenv:
+
+    python -m unittest
+
+Modules under app/ are imported the way app.py runs them (app/ on
+sys.path). Everything they would write (now-playing state, artwork cache,
+device mapping) goes to a temporary directory set up here, so this module
+must be imported before any of them.
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+TMP_DIR = tempfile.mkdtemp(prefix='skill-tests-')
+
+os.environ.update({
+    'NOW_PLAYING_STATE_PATH': os.path.join(TMP_DIR, 'now_playing.json'),
+    'SHARED_STORE_BACKEND': 'memory',
+    'ARTWORK_CACHE_DIR': os.path.join(TMP_DIR, 'artwork'),
+    'DEVICE_MAPPING_PATH': os.path.join(TMP_DIR, 'devices.json'),
+})
+for _key, _value in {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'PORT': '5000',
+    'QUIET_HTTP': '1',
+    'MA_HOSTNAME': 'ma.example.com',
+    'ENABLE_APL': 'true',
+    'SKIP_URL_VALIDATION': 'true',
+    # Tests that exercise coalescing and rate limiting switch them on.
+    'PUSH_COALESCE_WINDOW_SECONDS': '0',
+    'PUSH_RATE_LIMIT_PER_SECOND': '0',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+# Several tests provoke logged errors on purpose.
+logging.disable(logging.CRITICAL)
+
+_client = None
+
+
+def client():
+    """Flask test client for app/app.py (imported on first use)."""
+    global _client
+    if _client is None:
+        cwd = os.getcwd()
+        os.chdir(APP_DIR)
+        try:
+            import app as app_module
+        finally:
+            os.chdir(cwd)
+        _client = app_module.app.test_client()
+    return _client
+
+
+def envelope(request, device_id='amzn1.ask.device.test', apl=True):
+    interfaces = {'AudioPlayer': {}}
+    if apl:
+        interfaces['Alexa.Presentation.APL'] = {'runtime': {'maxVersion': '2024.3'}}
+    body = {
+        'requestId': 'EdwRequestId.test',
+        'locale': 'en-US',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+    body.update(request)
+    return {
+        'version': '1.0',
+        'session': {'new': False, 'sessionId': 'SessionId.test',
+                    'application': {'applicationId': ''}, 'user': {'userId': 'amzn1.ask.account.test'}},
+        'context': {'System': {'application': {'applicationId': ''},
+                               'device': {'deviceId': device_id, 'supportedInterfaces': interfaces}}},
+        'request': body,
+    }
+
+
+def metadata_refresh(**kwargs):
+    return envelope({'type': 'Alexa.Presentation.APL.UserEvent',
+                     'arguments': ['MetadataRefresh', 1], 'token': 'playbackToken'}, **kwargs)
+
+
+def launch(**kwargs):
+    return envelope({'type': 'LaunchRequest'}, **kwargs)
+
+
+def post_skill(payload, simulator=True):
+    """POST an envelope to the skill endpoint; return the Flask response.
+
+    With simulator, the request takes the app's verification bypass.
+    """
+    headers = {'Content-Type': 'application/json'}
+    if simulator:
+        headers['X-Simulator-Signature'] = 'test'
+    return client().post('/', data=json.dumps(payload), headers=headers)
+
+
+def push(title, player_id=None, **fields):
+    """POST a now-playing record to /ma/push-url; return the JSON answer."""
+    body = {
+        'streamUrl': f'https://ma.example.com/flow/{title}.mp3',
+        'title': title,
+        'artist': 'Test Artist',
+        'album': 'Test Album',
+    }
+    if player_id:
+        body['playerId'] = player_id
+    body.update(fields)
+    return client().post('/ma/push-url', json=body).get_json()
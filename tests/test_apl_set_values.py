@@ -0,0 +1,75 @@
+import unittest
+from unittest import mock
+
+from ask_sdk_model.interfaces.alexa.presentation.apl import RenderDocumentDirective
+
+from . import support  # noqa: F401  (sets up the environment first)
+
+import artwork_cache
+import shared_store
+from skill import apl
+
+COVER = 'https://skill.example.com/artwork/0123456789abcdef0123/cover'
+PREVIEW = 'https://skill.example.com/artwork/0123456789abcdef0123/preview'
+
+
+def metadata(title, image_url=COVER):
+    return dict(shared_store.NowPlaying(stream_url='https://ma.example.com/flow/x.mp3', title=title,
+                                        artist='Artist', album='Album', image_url=image_url).info)
+
+
+def set_values(commands):
+    return {command['property']: command['value'] for command in commands}
+
+
+class SetValueDiffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.device = self.id()
+        placeholder = mock.patch.object(artwork_cache, 'placeholder', return_value=None)
+        self.placeholder = placeholder.start()
+        self.addCleanup(placeholder.stop)
+
+    def test_first_refresh_sends_every_value(self):
+        values = set_values(apl.metadata_commands(metadata('a'), self.device))
+        self.assertEqual(values['primaryText'], 'a')
+        self.assertEqual(values['secondaryText'], 'Artist - Album')
+        self.assertEqual(values['coverImageSource'], COVER)
+        self.assertEqual(values['placeholderColor'], 'transparent')
+        self.assertNotIn('audioSources', values)
+
+    def test_only_changed_values_are_sent_to_a_device(self):
+        apl.metadata_commands(metadata('a'), self.device)
+        self.assertEqual(apl.metadata_commands(metadata('a'), self.device), [])
+        self.assertEqual(set_values(apl.metadata_commands(metadata('b'), self.device)), {'primaryText': 'b'})
+
+    def test_devices_are_diffed_separately(self):
+        apl.metadata_commands(metadata('a'), self.device)
+        other = set_values(apl.metadata_commands(metadata('a'), self.device + '-other'))
+        self.assertEqual(other['primaryText'], 'a')
+
+    def test_without_a_device_every_value_is_sent(self):
+        apl.metadata_commands(metadata('a'), self.device)
+        self.assertEqual(set_values(apl.metadata_commands(metadata('a')))['primaryText'], 'a')
+
+    def test_rendered_document_counts_as_shown(self):
+        fields = metadata('a')
+        directive = RenderDocumentDirective(
+            token='playbackToken', document={},
+            datasources={'nowPlaying': dict(fields, placeholderColor='transparent', coverPreviewSource='')})
+        apl.note_rendered(self.device, directive)
+        self.assertEqual(apl.metadata_commands(fields, self.device), [])
+
+    def test_placeholders_found_later_are_pending_and_sent_alone(self):
+        fields = metadata('a')
+        apl.metadata_commands(fields, self.device)
+        self.assertFalse(apl.placeholders_pending(fields, self.device))
+        self.placeholder.return_value = ('#123456', PREVIEW)
+        self.assertTrue(apl.placeholders_pending(fields, self.device))
+        self.assertEqual(set_values(apl.metadata_commands(fields, self.device)),
+                         {'placeholderColor': '#123456', 'coverPreviewSource': PREVIEW})
+        self.assertFalse(apl.placeholders_pending(fields, self.device))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from . import support
+
+import artwork_cache
+import push_coalescer
+import shared_store
+
+
+class ArtworkRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(dir=support.TMP_DIR)
+        patches = [
+            mock.patch.dict(os.environ, {'ARTWORK_CACHE_DIR': self.directory,
+                                         'SKILL_HOSTNAME': 'skill.example.com'}),
+            # A fresh registry, loaded from this test's directory.
+            mock.patch.object(artwork_cache, '_registry', None),
+            mock.patch.object(artwork_cache, '_REGISTRY_MAX', 5),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        warm = mock.patch.object(artwork_cache, '_warm_all')
+        self.warm = warm.start()
+        self.addCleanup(warm.stop)
+
+    def saved(self):
+        with open(os.path.join(self.directory, artwork_cache._REGISTRY_FILE)) as f:
+            return json.load(f)
+
+    def test_registry_keeps_the_most_recent_urls(self):
+        urls = [f'http://10.0.0.1/cover{i}.jpg' for i in range(8)]
+        keys = artwork_cache.register_all(urls, warm=False)
+        self.assertEqual(list(self.saved()), keys[3:])
+        # Evicted keys are no longer served.
+        self.assertIsNone(artwork_cache.get(keys[0], 'cover'))
+
+    def test_registering_again_refreshes_a_url(self):
+        urls = [f'http://10.0.0.1/cover{i}.jpg' for i in range(5)]
+        keys = artwork_cache.register_all(urls, warm=False)
+        artwork_cache.register(urls[0], warm=False)
+        artwork_cache.register('http://10.0.0.1/new.jpg', warm=False)
+        self.assertIn(keys[0], self.saved())
+        self.assertNotIn(keys[1], self.saved())
+
+    def test_offered_url_is_registered_only_when_published(self):
+        url = artwork_cache.offer('http://10.0.0.1/offered.jpg', 'fallback')
+        key = artwork_cache._key('http://10.0.0.1/offered.jpg')
+        self.assertEqual(url, f'https://skill.example.com/artwork/{key}/cover')
+        self.assertFalse(os.path.exists(os.path.join(self.directory, artwork_cache._REGISTRY_FILE)))
+        self.warm.assert_not_called()
+
+        shared_store.publish(shared_store.NowPlaying(stream_url='https://ma.example.com/a.mp3', image_url=url),
+                             player_id=self.id())
+        self.assertEqual(self.saved(), {key: 'http://10.0.0.1/offered.jpg'})
+        self.warm.assert_called_once()
+
+    def test_push_storm_fetches_only_applied_artwork(self):
+        with mock.patch.dict(os.environ, {'PUSH_COALESCE_WINDOW_SECONDS': '60'}):
+            for i in range(10):
+                support.push(f'storm{i}', player_id=self.id(), imageUrl=f'http://10.0.0.1/storm{i}.jpg')
+        self.assertEqual(len(self.saved()), 1)
+        self.assertEqual(self.warm.call_count, 1)
+        # Apply the staged push now instead of when its window closes.
+        push_coalescer._slots[self.id()].timer.cancel()
+        push_coalescer._flush(self.id(), self.id())
+        self.assertEqual(len(self.saved()), 2)
+        self.assertIn(artwork_cache._key('http://10.0.0.1/storm9.jpg'), self.saved())
+
+
+if __name__ == '__main__':
+    unittest.main()
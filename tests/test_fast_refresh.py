@@ -0,0 +1,59 @@
+import os
+import unittest
+from unittest import mock
+
+from . import support
+
+from skill import fast_refresh, refresh_schedule
+
+
+def set_values(response):
+    directives = response.get_json()['response'].get('directives', [])
+    return {command['property']: command['value']
+            for directive in directives if directive['type'] == 'Alexa.Presentation.APL.ExecuteCommands'
+            for command in directive['commands'] if command['type'] == 'SetValue'}
+
+
+class FastRefreshTest(unittest.TestCase):
+
+    def setUp(self):
+        self.device = self.id()
+        support.push(self.id())
+        # The full handler marks the current version as seen by this device.
+        self.assertEqual(support.post_skill(support.metadata_refresh(device_id=self.device)).status_code, 200)
+        env = mock.patch.dict(os.environ, {'APL_FAST_REFRESH': 'true'})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def refresh(self, **kwargs):
+        return support.post_skill(support.metadata_refresh(device_id=self.device), **kwargs)
+
+    def test_unchanged_refresh_takes_the_fast_path(self):
+        before = fast_refresh.stats()['fast']
+        self.assertEqual(self.refresh().status_code, 200)
+        self.assertEqual(fast_refresh.stats()['fast'], before + 1)
+
+    def test_fast_response_matches_the_full_dispatch(self):
+        # The delay backs off per refresh; pin it so both answers can be compared.
+        with mock.patch.object(refresh_schedule, 'next_delay_ms', return_value=4000):
+            fast = self.refresh().get_json()
+            os.environ['APL_FAST_REFRESH'] = 'false'
+            full = self.refresh().get_json()
+        self.assertEqual(fast, full)
+
+    def test_new_version_goes_through_the_full_dispatch(self):
+        support.push(self.id() + '-next')
+        before = fast_refresh.stats()
+        response = self.refresh()
+        self.assertEqual(fast_refresh.stats()['fast'], before['fast'])
+        self.assertEqual(set_values(response)['primaryText'], self.id() + '-next')
+
+    def test_other_requests_are_not_answered(self):
+        self.assertFalse(fast_refresh.unchanged(support.launch(device_id=self.device)))
+
+    def test_unsigned_request_is_rejected(self):
+        self.assertEqual(self.refresh(simulator=False).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import threading
+import time
+import unittest
+
+from . import support
+
+import event_bus
+import shared_store
+from music_assistant_api import ma_routes
+
+
+def later(seconds, fn, *args):
+    timer = threading.Timer(seconds, fn, args)
+    timer.start()
+    return timer
+
+
+class MaLatestUrlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = support.client()
+        self.player = self.id()
+        support.push('first', player_id=self.player)
+        self.url = f'/ma/latest-url?playerId={self.player}'
+
+    def get(self, query='', etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(self.url + query, headers=headers)
+
+    def test_matching_etag_gets_304(self):
+        etag = self.get().headers['ETag']
+        self.assertEqual(self.get(etag=etag).status_code, 304)
+
+    def test_new_record_gets_200_and_a_new_etag(self):
+        etag = self.get().headers['ETag']
+        support.push('second', player_id=self.player)
+        response = self.get(etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['title'], 'second')
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_etag_depends_on_content_not_only_the_version(self):
+        # After a restart without saved state, version numbers are handed out again.
+        a = shared_store.NowPlaying(stream_url='https://ma.example.com/a.mp3', title='a', version=1)
+        b = shared_store.NowPlaying(stream_url='https://ma.example.com/b.mp3', title='b', version=1)
+        self.assertNotEqual(ma_routes._etag(a), ma_routes._etag(b))
+
+    def test_long_poll_on_the_current_etag_returns_the_next_record(self):
+        etag = self.get().headers['ETag']
+        later(0.2, support.push, 'second', self.player)
+        started = time.monotonic()
+        response = self.get('&wait=5', etag=etag)
+        self.assertLess(time.monotonic() - started, 3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['title'], 'second')
+
+    def test_long_poll_with_since_waits_for_a_newer_version(self):
+        version = self.get().get_json()['version']
+        later(0.2, support.push, 'second', self.player)
+        response = self.get(f'&wait=5&since={version}')
+        self.assertEqual(response.get_json()['title'], 'second')
+
+    def test_stale_etag_or_invalid_wait_is_answered_at_once(self):
+        for query, etag in (('&wait=5', '"1-0000000000000000"'), ('&wait=nan', None), ('&wait=inf', None)):
+            started = time.monotonic()
+            response = self.get(query, etag=etag)
+            self.assertLess(time.monotonic() - started, 1, query)
+            self.assertEqual(response.status_code, 200, query)
+
+
+class AlexaLatestUrlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = support.client()
+        self.handed_out(self.id())
+
+    def handed_out(self, title):
+        event_bus.publish(event_bus.ALEXA_NOW_PLAYING, {
+            'streamUrl': f'https://ma.example.com/flow/{title}.mp3', 'title': title,
+            'secondary': None, 'imageUrl': None})
+
+    def test_matching_etag_gets_304_until_the_next_stream(self):
+        etag = self.client.get('/alexa/latest-url').headers['ETag']
+        self.assertEqual(self.client.get('/alexa/latest-url', headers={'If-None-Match': etag}).status_code, 304)
+        self.handed_out(self.id() + '-next')
+        response = self.client.get('/alexa/latest-url', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['title'], self.id() + '-next')
+
+    def test_long_poll_wakes_on_the_next_stream(self):
+        etag = self.client.get('/alexa/latest-url').headers['ETag']
+        later(0.2, self.handed_out, self.id() + '-next')
+        response = self.client.get('/alexa/latest-url?wait=5', headers={'If-None-Match': etag})
+        self.assertEqual(response.get_json()['title'], self.id() + '-next')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from . import support  # noqa: F401  (sets up the environment first)
+
+import push_coalescer
+import shared_store
+
+
+def record(title, **fields):
+    return shared_store.NowPlaying(stream_url=f'https://ma.example.com/flow/{title}.mp3', title=title, **fields)
+
+
+class _SlowFirstLock:
+    """A lock whose first acquirer stalls before taking it, as if descheduled."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entered = 0
+
+    def __enter__(self):
+        self._entered += 1
+        if self._entered == 1:
+            time.sleep(0.3)
+        self._lock.acquire()
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+class PushCoalescerTest(unittest.TestCase):
+
+    def setUp(self):
+        # Unique per test: slots and buckets are module state.
+        self.player = self.id()
+        env = mock.patch.dict(os.environ, {'PUSH_COALESCE_WINDOW_SECONDS': '0',
+                                           'PUSH_RATE_LIMIT_PER_SECOND': '0'})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def submit(self, rec, source=None):
+        return push_coalescer.submit(rec, player_id=self.player, source=source or self.id())
+
+    def test_unchanged_push_is_dropped(self):
+        outcome, version = self.submit(record('a'))
+        self.assertEqual(outcome, push_coalescer.ACCEPTED)
+        self.assertEqual(self.submit(record('a')), (push_coalescer.UNCHANGED, version))
+        self.assertEqual(shared_store.get_latest(self.player).version, version)
+
+    def test_position_advancing_with_the_clock_is_unchanged_but_a_seek_is_not(self):
+        self.submit(record('a', duration=200.0, elapsed=10.0, timestamp=1000.0))
+        outcome, _ = self.submit(record('a', duration=200.0, elapsed=15.0, timestamp=1005.0))
+        self.assertEqual(outcome, push_coalescer.UNCHANGED)
+        outcome, _ = self.submit(record('a', duration=200.0, elapsed=90.0, timestamp=1006.0))
+        self.assertEqual(outcome, push_coalescer.ACCEPTED)
+
+    def test_burst_applies_the_first_and_the_last_push(self):
+        os.environ['PUSH_COALESCE_WINDOW_SECONDS'] = '0.1'
+        outcomes = [self.submit(record(f't{i}'))[0] for i in range(5)]
+        self.assertEqual(outcomes, [push_coalescer.ACCEPTED] + [push_coalescer.COALESCED] * 4)
+        self.assertEqual(shared_store.get_latest(self.player).title, 't0')
+        time.sleep(0.3)
+        self.assertEqual(shared_store.get_latest(self.player).title, 't4')
+        self.assertEqual(push_coalescer.stats()['staged'], 0)
+
+    def test_token_bucket_rejects_pushes_beyond_the_burst(self):
+        os.environ.update({'PUSH_RATE_LIMIT_PER_SECOND': '1', 'PUSH_RATE_LIMIT_BURST': '3'})
+        outcomes = [self.submit(record(f't{i}'), source='storm')[0] for i in range(4)]
+        self.assertEqual(outcomes[:3], [push_coalescer.ACCEPTED] * 3)
+        self.assertEqual(outcomes[3], push_coalescer.RATE_LIMITED)
+        # Buckets are per source address.
+        self.assertEqual(self.submit(record('other'), source='calm')[0], push_coalescer.ACCEPTED)
+
+    def test_write_overtaken_by_a_later_push_is_dropped(self):
+        os.environ['PUSH_COALESCE_WINDOW_SECONDS'] = '0.05'
+        results = {}
+        with mock.patch.object(push_coalescer, '_apply_lock', _SlowFirstLock()):
+            leading = threading.Thread(target=lambda: results.setdefault('old', self.submit(record('old'))))
+            leading.start()
+            time.sleep(0.02)
+            self.assertEqual(self.submit(record('new'))[0], push_coalescer.COALESCED)
+            leading.join()
+            time.sleep(0.1)
+        self.assertEqual(results['old'], (push_coalescer.COALESCED, None))
+        self.assertEqual(shared_store.get_latest(self.player).title, 'new')
+
+    def test_slots_are_bounded(self):
+        with mock.patch.object(push_coalescer, '_SLOTS_MAX', 4):
+            for i in range(10):
+                push_coalescer.submit(record('a'), player_id=f'{self.player}-{i}', source=self.id())
+            self.assertLessEqual(len(push_coalescer._slots), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+from . import support
+
+import shared_store
+
+WRITES = 50
+
+# Publishes WRITES records as `worker` and prints the versions it was given.
+_WRITER = textwrap.dedent('''
+    import sys
+    sys.path.insert(0, sys.argv[1])
+    import shared_store
+    store = shared_store.SQLiteBackend(sys.argv[2])
+    worker = sys.argv[3]
+    for i in range(int(sys.argv[4])):
+        record = {'streamUrl': f'https://ma.example.com/{worker}/{i}.mp3', 'title': f'{worker} {i}'}
+        print(store.publish(record, player_id=worker).version)
+''')
+
+
+class SQLiteStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(dir=support.TMP_DIR), 'store.sqlite3')
+        self.store = shared_store.SQLiteBackend(self.path)
+
+    def test_versions_are_unique_across_processes(self):
+        writers = [subprocess.Popen([sys.executable, '-c', _WRITER, support.APP_DIR, self.path, f'w{n}', str(WRITES)],
+                                    stdout=subprocess.PIPE, text=True, env=os.environ.copy())
+                   for n in range(3)]
+        versions = []
+        for writer in writers:
+            out, _err = writer.communicate(timeout=60)
+            self.assertEqual(writer.returncode, 0)
+            versions.extend(int(line) for line in out.split())
+        self.assertEqual(sorted(versions), list(range(1, 3 * WRITES + 1)))
+
+        latest = self.store.get(shared_store._LATEST_KEY)
+        self.assertEqual(latest.version, 3 * WRITES)
+        self.assertEqual(self.store.player_ids(), ['w0', 'w1', 'w2'])
+        for n in range(3):
+            record = self.store.get(f'w{n}')
+            self.assertEqual(record.title, f'w{n} {WRITES - 1}')
+            self.assertEqual(record.player_id, f'w{n}')
+
+    def test_reader_sees_a_record_published_by_another_process(self):
+        self.store.publish({'streamUrl': 'https://ma.example.com/old.mp3', 'title': 'old'}, player_id='p')
+        self.assertEqual(self.store.get('p').title, 'old')
+        subprocess.run([sys.executable, '-c', _WRITER, support.APP_DIR, self.path, 'p', '1'],
+                       check=True, capture_output=True, env=os.environ.copy(), timeout=60)
+        record = self.store.get('p')
+        self.assertEqual(record.title, 'p 0')
+        self.assertEqual(record.version, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()